@@ -1,30 +1,117 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from sqlalchemy import delete, func, inspect, select, text, update
 from routes.user import user
 from routes.product import product
 from routes.order import order
 from routes.cart import cart
 from routes.token import router as token
-from config.db import Base, engine, create_database
+from routes.stats import stats
+from routes.metrics import metrics
+from routes.batch import batch
+from config.db import (
+    Base, FAST_STARTUP, create_database, dispose_engine, get_engine, mark_schema_current, schema_is_current
+)
+from utils.compression import CompressionMiddleware
+from utils.metrics import MetricsMiddleware
+from utils.query_stats import QueryStatsMiddleware
+from utils.read_routing import ReadRoutingMiddleware
+from utils.jobs import job_queue
+from utils.passwords import shutdown_hash_executor
 from models.user import User
 from models.order import Order, OrderItem
 from models.product import Product
 from models.cart import Cart, CartItem
 
-app = FastAPI()
+
+# create_all skips existing tables, so columns added later are created separately.
+# They are added as nullable because existing rows have no value for them yet.
+def add_missing_columns(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+# create_all skips existing tables, so indexes added later are created separately
+def create_missing_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# Carts created before the (cart_id, product_id) unique index may hold several rows per product.
+# They are merged into the oldest row so the index can be created.
+def merge_duplicate_cart_items(connection):
+    items = CartItem.__table__
+    duplicates = connection.execute(
+        select(items.c.cart_id, items.c.product_id, func.min(items.c.id), func.sum(items.c.quantity))
+        .group_by(items.c.cart_id, items.c.product_id)
+        .having(func.count() > 1)
+    ).all()
+    for cart_id, product_id, keep_id, quantity in duplicates:
+        connection.execute(update(items).where(items.c.id == keep_id).values(quantity=quantity))
+        connection.execute(
+            delete(items).where(items.c.cart_id == cart_id, items.c.product_id == product_id, items.c.id != keep_id)
+        )
+
+
+# Order items placed before prices were snapshotted get the current product price
+def backfill_order_item_prices(connection):
+    items = OrderItem.__table__
+    price = select(Product.__table__.c.price).where(Product.__table__.c.id == items.c.product_id).scalar_subquery()
+    connection.execute(update(items).where(items.c.unit_price.is_(None)).values(unit_price=func.coalesce(price, 0)))
+    connection.execute(
+        update(items).where(items.c.line_total.is_(None)).values(line_total=items.c.unit_price * items.c.quantity)
+    )
+
+
+# Create tables only if they do not exist
+async def create_tables():
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(merge_duplicate_cart_items)
+        await conn.run_sync(create_missing_indexes)
+        await conn.run_sync(backfill_order_item_prices)
+        await mark_schema_current(conn)
+
+
+# Skip the bootstrap when the schema version marker already matches
+async def bootstrap_schema():
+    if FAST_STARTUP and await schema_is_current():
+        return
+    await create_database()
+    await create_tables()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await bootstrap_schema()
+    job_queue.start()
+    yield
+    # Queued jobs may still need the database
+    await job_queue.stop()
+    shutdown_hash_executor()
+    await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(ReadRoutingMiddleware)
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(user)
 app.include_router(product)
 app.include_router(order)
 app.include_router(cart)
 app.include_router(token)
-
-
-# Create tables only if they do not exist
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-
-# Run on startup
-@app.on_event("startup")
-async def on_startup():
-    create_database()
-    create_tables()
\ No newline at end of file
+app.include_router(stats)
+app.include_router(metrics)
+app.include_router(batch)
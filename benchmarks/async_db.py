@@ -0,0 +1,129 @@
+"""Concurrent-request throughput of a blocking sync Session vs the async session.
+
+Each request runs one product lookup that takes SLOW_QUERY_MS inside SQLite.
+The product cache is turned off, so every request reaches the database.
+Run from the repository root:
+
+    python -m benchmarks.async_db
+"""
+import asyncio
+import time
+
+from benchmarks.common import BENCH_DB, reset_db_file
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app import app
+from config.db import Base, get_db, to_async_url
+from models.product import Product as ProductModel
+from schemas.product import ProductOut
+from utils.cache import MemoryCache, get_product_cache
+
+SLOW_QUERY_MS = 20
+CONCURRENCY = 10
+REQUESTS = 100
+
+DB_URL = f"sqlite:///{BENCH_DB}"
+
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+def _register_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep_ms", 1, _sleep_ms)
+
+
+def _make_slow(conn, cursor, statement, parameters, context, executemany):
+    if statement.startswith("SELECT") and "WHERE" in statement:
+        statement = f"{statement} AND sleep_ms({SLOW_QUERY_MS}) > 0"
+    return statement, parameters
+
+
+def _slow_engine(engine):
+    event.listen(engine, "connect", _register_sleep)
+    event.listen(engine, "before_cursor_execute", _make_slow, retval=True)
+    return engine
+
+
+# Pre-async handler: async def route doing blocking work on a sync Session
+sync_engine = _slow_engine(create_engine(DB_URL))
+SyncSession = sessionmaker(bind=sync_engine)
+
+blocking_app = FastAPI()
+
+
+def get_sync_db():
+    db = SyncSession()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@blocking_app.get("/products/products/{product_id}", response_model=ProductOut)
+async def blocking_get_product(product_id: int, db=Depends(get_sync_db)):
+    product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+
+# Real app with get_db pointed at an async engine that runs the same slow query
+async_engine = create_async_engine(to_async_url(DB_URL))
+_slow_engine(async_engine.sync_engine)
+AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+async def get_slow_db():
+    async with AsyncSession() as db:
+        yield db
+
+
+async def seed():
+    reset_db_file()
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession() as db:
+        db.add(ProductModel(name="widget", description="bench", price=9.99, in_stock=True))
+        await db.commit()
+
+
+async def run(target, label):
+    transport = httpx.ASGITransport(app=target)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get("/products/products/1")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{label:<24} {REQUESTS / elapsed:8.1f} req/s  ({elapsed:.2f}s for {REQUESTS} requests, concurrency {CONCURRENCY})")
+
+
+async def main():
+    await seed()
+    app.dependency_overrides[get_db] = get_slow_db
+    uncached = MemoryCache(1, 0)
+    app.dependency_overrides[get_product_cache] = lambda: uncached
+    try:
+        await run(blocking_app, "sync Session (before)")
+        await run(app, "AsyncSession (after)")
+    finally:
+        app.dependency_overrides.clear()
+        await async_engine.dispose()
+        sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
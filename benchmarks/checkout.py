@@ -0,0 +1,113 @@
+"""Cart checkout: POST /carts/{id}/checkout vs re-posting the cart to POST /orders/.
+
+Reports queries and latency per checkout for both flows, then checks each
+cart out from several concurrent requests and exits non-zero unless
+exactly one of them created an order. Run from the repository root:
+
+    python -m benchmarks.checkout
+"""
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.common import reset_db_file
+
+import httpx
+from sqlalchemy import event, func, select
+
+from app import app, create_tables
+from config.db import SessionLocal, get_engine
+from models.cart import Cart, CartItem
+from models.order import Order
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+
+engine = get_engine()
+
+PRODUCTS = 50
+ITEMS_PER_CART = 20
+CARTS = 50
+RACERS = 8
+
+statements = []
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+async def seed():
+    reset_db_file()
+    await create_tables()
+    async with SessionLocal() as db:
+        db.add(User(username="buyer", first_name="f", last_name="l", email="buyer@example.com", hashed_password="x"))
+        db.add_all([Product(name=f"p{i}", description="d", price=1 + i, in_stock=True) for i in range(PRODUCTS)])
+        await db.flush()
+        db.add_all([
+            Cart(user_id=1, items=[CartItem(product_id=p + 1, quantity=1 + p % 3) for p in range(ITEMS_PER_CART)])
+            for _ in range(CARTS * 3)
+        ])
+        await db.commit()
+
+
+# The flow clients used before: read the cart, then post every line as a new order
+async def repost_cart(client, cart_id):
+    cart = (await client.get(f"/carts/{cart_id}")).raise_for_status().json()
+    order = {"user_id": cart["user_id"], "created_at": datetime.utcnow().isoformat(), "items": cart["items"]}
+    (await client.post("/orders/", json=order)).raise_for_status()
+
+
+async def checkout(client, cart_id):
+    (await client.post(f"/carts/{cart_id}/checkout")).raise_for_status()
+
+
+async def measure(label, client, flow, cart_ids):
+    timings = []
+    statements.clear()
+    for cart_id in cart_ids:
+        start = time.perf_counter()
+        await flow(client, cart_id)
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<18} {len(statements) / len(cart_ids):5.1f} queries  "
+          f"p50 {statistics.median(timings) * 1000:6.2f} ms  max {max(timings) * 1000:6.2f} ms")
+
+
+async def race(client, cart_ids) -> bool:
+    async with SessionLocal() as db:
+        before = await db.scalar(select(func.count()).select_from(Order))
+
+    statuses = []
+    for cart_id in cart_ids:
+        responses = await asyncio.gather(*(client.post(f"/carts/{cart_id}/checkout") for _ in range(RACERS)))
+        statuses.append(sorted(response.status_code for response in responses))
+
+    async with SessionLocal() as db:
+        created = await db.scalar(select(func.count()).select_from(Order)) - before
+        left = await db.scalar(select(func.count()).select_from(CartItem).where(CartItem.cart_id.in_(cart_ids)))
+
+    expected = [200] + [400] * (RACERS - 1)
+    ok = created == len(cart_ids) and left == 0 and all(s == expected for s in statuses)
+    print(f"concurrent checkout: {len(cart_ids)} carts x {RACERS} requests -> {created} orders, "
+          f"{left} items left in carts  {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+async def main():
+    await seed()
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'buyer'})}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        await measure("GET cart + POST", client, repost_cart, range(1, CARTS + 1))
+        await measure("checkout", client, checkout, range(CARTS + 1, 2 * CARTS + 1))
+        ok = await race(client, list(range(2 * CARTS + 1, 3 * CARTS + 1)))
+    await engine.dispose()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
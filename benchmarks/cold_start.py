@@ -0,0 +1,61 @@
+"""Import plus first-request time of a fresh interpreter, as on a serverless cold start.
+
+Each sample runs in a new process: import app, run the lifespan startup,
+then serve GET /products/products. The database already exists, as it
+would after the first deployment. Run from the repository root:
+
+    python -m benchmarks.cold_start
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import reset_db_file
+
+SAMPLES = 5
+
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+import benchmarks.common
+from app import app
+imported = time.perf_counter()
+
+import httpx
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/products/products")).raise_for_status()
+        return started, time.perf_counter()
+
+started, served = asyncio.run(first_request())
+print(json.dumps({"import": imported - start, "startup": started - imported, "first_request": served - started}))
+"""
+
+
+def sample(fast_startup: bool) -> dict:
+    env = dict(os.environ, FAST_STARTUP="true" if fast_startup else "false")
+    output = subprocess.run([sys.executable, "-c", CHILD], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    reset_db_file()
+    # Bootstrap once so both modes start from an existing schema
+    sample(fast_startup=False)
+
+    print(f"{'mode':<16} {'import ms':>10} {'startup ms':>11} {'1st req ms':>11} {'total ms':>9}")
+    for label, fast in (("full bootstrap", False), ("fast startup", True)):
+        runs = [sample(fast) for _ in range(SAMPLES)]
+        medians = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        total = sum(medians.values())
+        print(f"{label:<16} {medians['import']:>10.1f} {medians['startup']:>11.1f} {medians['first_request']:>11.1f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+# Benchmarks run against a throwaway SQLite file instead of MySQL
+BENCH_DB = os.path.join(tempfile.gettempdir(), "ecommerce_bench.db")
+
+os.environ.setdefault("DB_URL_WITHOUT_DB", "sqlite:///")
+os.environ.setdefault("DATABASE_NAME", BENCH_DB)
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+
+def reset_db_file(path: str = BENCH_DB):
+    if os.path.exists(path):
+        os.remove(path)
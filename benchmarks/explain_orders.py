@@ -0,0 +1,88 @@
+"""Checks that the order history and item lookups are served by their indexes.
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for each query against a seeded
+database and exits non-zero if the plan does not name the expected index.
+Run from the repository root:
+
+    python -m benchmarks.explain_orders
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import reset_db_file
+
+from sqlalchemy import select, text
+
+from app import create_tables
+from config.db import SessionLocal, get_engine
+from models.cart import Cart, CartItem
+from models.order import Order, OrderItem
+from models.product import Product
+from models.user import User
+from routes.order import my_orders_query
+
+engine = get_engine()
+
+USERS = 20
+ORDERS_PER_USER = 50
+
+
+async def seed():
+    async with SessionLocal() as db:
+        users = [User(username=f"u{i}", first_name="a", last_name="b", email=f"u{i}@example.com",
+                      hashed_password="x", is_admin=False) for i in range(USERS)]
+        product = Product(name="p", description="d", price=1, in_stock=True)
+        db.add_all(users + [product])
+        await db.flush()
+
+        start = datetime(2024, 1, 1)
+        for user in users:
+            for n in range(ORDERS_PER_USER):
+                db.add(Order(user_id=user.id, total_price=1, status="pending" if n % 3 else "shipped",
+                             created_at=start + timedelta(hours=n),
+                             items=[OrderItem(product_id=product.id, quantity=1, unit_price=1, line_total=1)]))
+            db.add(Cart(user_id=user.id, items=[CartItem(product_id=product.id, quantity=1)]))
+        await db.commit()
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+
+
+def checks():
+    history = my_orders_query(1, None, None, None).limit(51)
+    filtered = my_orders_query(1, "pending", datetime(2024, 1, 1), datetime(2024, 1, 2)).limit(51)
+    return [
+        ("order history", history, "ix_orders_user_id_created_at"),
+        ("order history, filtered", filtered, "ix_orders_user_id_created_at"),
+        ("order items by order", select(OrderItem).where(OrderItem.order_id.in_([1, 2, 3])), "ix_order_items_order_id"),
+        ("cart items by cart", select(CartItem).where(CartItem.cart_id == 1), "uq_cart_items_cart_product"),
+    ]
+
+
+async def explain(conn, query) -> str:
+    sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    rows = (await conn.execute(text(f"{prefix} {sql}"))).all()
+    return "\n".join(" | ".join(str(value) for value in row) for row in rows)
+
+
+async def main():
+    reset_db_file()
+    await create_tables()
+    await seed()
+
+    failed = False
+    async with engine.connect() as conn:
+        for name, query, index in checks():
+            plan = await explain(conn, query)
+            used = index in plan
+            failed = failed or not used
+            print(f"{'ok  ' if used else 'FAIL'} {name}: expected {index}")
+            print("     " + plan.replace("\n", "\n     "))
+    await engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,85 @@
+"""Flash sale on one hot product: concurrent POST /orders/ against a limited stock.
+
+Sends more orders than there are units, then checks that every unit was
+sold at most once: units in successful orders plus the remaining stock must
+equal the starting stock, and the stock may never go negative. Exits
+non-zero on an oversell and reports orders per second. Run from the
+repository root:
+
+    python -m benchmarks.flash_sale
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.common import reset_db_file
+
+import httpx
+from sqlalchemy import func, select
+
+from app import app, create_tables
+from config.db import SessionLocal, get_engine
+from models.order import OrderItem
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+
+engine = get_engine()
+
+STOCK = 300
+ATTEMPTS = 600
+CONCURRENCY = 50
+USERS = 50
+
+
+async def seed():
+    reset_db_file()
+    await create_tables()
+    async with SessionLocal() as db:
+        db.add_all([
+            User(username=f"buyer{i}", first_name="f", last_name="l", email=f"buyer{i}@example.com", hashed_password="x")
+            for i in range(USERS)
+        ])
+        db.add(Product(name="hot", description="limited", price=10, in_stock=True, stock=STOCK))
+        await db.commit()
+
+
+async def main():
+    random.seed(1)
+    await seed()
+    tokens = [create_access_token({"sub": f"buyer{i}"}) for i in range(USERS)]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    transport = httpx.ASGITransport(app=app)
+    statuses = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(n):
+            order = {
+                "user_id": 0,
+                "created_at": datetime.utcnow().isoformat(),
+                "items": [{"product_id": 1, "quantity": random.randint(1, 3)}],
+            }
+            async with semaphore:
+                response = await client.post("/orders/", json=order, headers={"Authorization": f"Bearer {tokens[n % USERS]}"})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(ATTEMPTS)))
+        elapsed = time.perf_counter() - start
+
+    async with SessionLocal() as db:
+        product = await db.get(Product, 1)
+        sold = await db.scalar(select(func.coalesce(func.sum(OrderItem.quantity), 0)).where(OrderItem.product_id == 1))
+    await engine.dispose()
+
+    ok = product.stock >= 0 and sold + product.stock == STOCK and product.in_stock == (product.stock > 0)
+    print(f"responses: {dict(sorted(statuses.items()))}")
+    print(f"stock {STOCK} -> {product.stock}, units sold {sold}, in_stock {product.in_stock}  {'ok' if ok else 'OVERSOLD'}")
+    print(f"{statuses.get(200, 0) / elapsed:.1f} orders/s, {ATTEMPTS / elapsed:.1f} attempts/s over {elapsed:.2f} s")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,156 @@
+"""Background job queue: capacity, retries with backoff, drain on shutdown.
+
+Runs the queue with an in-memory backend and throwaway job types, then
+places an order through the app and checks its OrderPlaced job ran, and
+compares order latency with a slow side effect run inline and queued.
+Exits non-zero on any failed check. Run from the repository root:
+
+    python -m benchmarks.jobs
+"""
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.common import reset_db_file
+
+import httpx
+from pydantic import BaseModel
+
+from app import app, bootstrap_schema
+from config.db import SessionLocal, dispose_engine
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+from utils.jobs import JobQueue, MemoryJobBackend, job_handler, job_queue
+from utils.order_jobs import OrderPlaced
+
+ORDERS = 50
+SIDE_EFFECT_SECONDS = 0.02
+
+failures = []
+attempts = {}
+
+
+def check(label: str, ok: bool):
+    print(f"{'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+class Flaky(BaseModel):
+    key: str
+    failures: int
+
+
+class Slow(BaseModel):
+    seconds: float
+
+
+@job_handler(Flaky)
+async def run_flaky(job: Flaky):
+    attempts[job.key] = attempts.get(job.key, 0) + 1
+    if attempts[job.key] <= job.failures:
+        raise RuntimeError(f"attempt {attempts[job.key]} of {job.key} failed")
+
+
+@job_handler(Slow)
+async def run_slow(job: Slow):
+    await asyncio.sleep(job.seconds)
+
+
+async def check_queue():
+    queue = JobQueue(MemoryJobBackend(3), workers=2, max_attempts=3, backoff=0.01)
+    accepted = [await queue.enqueue(Slow(seconds=0)) for _ in range(4)]
+    check("capacity is bounded", accepted == [True, True, True, False])
+    queue.start()
+    await queue.stop()
+    check("queued jobs run once workers start", queue.completed == 3)
+
+    queue.start()
+    await queue.enqueue(Flaky(key="recovers", failures=2))
+    await queue.enqueue(Flaky(key="gives-up", failures=10))
+    await queue.stop()
+    check("failed job is retried until it succeeds", attempts["recovers"] == 3 and queue.completed == 4)
+    check("job stops after max_attempts", attempts["gives-up"] == 3 and queue.failed == 1)
+    check("backoff doubles", [queue.retry_delay(n) for n in (1, 2, 3)] == [0.01, 0.02, 0.04])
+
+    queue = JobQueue(MemoryJobBackend(100), workers=4)
+    queue.start()
+    for _ in range(40):
+        await queue.enqueue(Slow(seconds=0.01))
+    await queue.stop()
+    check("shutdown drains the queue", queue.completed == 40)
+    check("stopped queue drops new jobs", not await queue.enqueue(Slow(seconds=0)))
+
+    queue = JobQueue(MemoryJobBackend(100), workers=1)
+    queue.start()
+    await queue.enqueue(Slow(seconds=5))
+    start = time.perf_counter()
+    await queue.stop(timeout=0.1)
+    check("drain gives up after its timeout", time.perf_counter() - start < 1)
+
+
+async def seed():
+    reset_db_file()
+    await bootstrap_schema()
+    async with SessionLocal() as db:
+        db.add(User(username="buyer", first_name="f", last_name="l", email="buyer@example.com", hashed_password="x"))
+        db.add(Product(name="p", description="d", price=5, in_stock=True))
+        await db.commit()
+
+
+async def place_orders(client) -> float:
+    order = {"user_id": 1, "created_at": datetime.utcnow().isoformat(), "items": [{"product_id": 1, "quantity": 1}]}
+    timings = []
+    for _ in range(ORDERS):
+        start = time.perf_counter()
+        (await client.post("/orders/", json=order)).raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+class InlineQueue:
+    async def enqueue(self, job):
+        await asyncio.sleep(SIDE_EFFECT_SECONDS)
+        return True
+
+
+async def check_orders():
+    from utils.jobs import get_job_queue, job_handlers
+
+    await seed()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'buyer'})}"}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", headers=headers) as client:
+            await place_orders(client)
+            await asyncio.sleep(0.1)
+            check("order placement runs OrderPlaced", job_queue.completed == ORDERS and job_queue.failed == 0)
+
+            # A slow side effect (e.g. sending an email) inline in the request, then queued
+            record_order_placed = job_handlers[OrderPlaced]
+
+            async def slow_side_effect(job):
+                await asyncio.sleep(SIDE_EFFECT_SECONDS)
+                await record_order_placed(job)
+
+            app.dependency_overrides[get_job_queue] = InlineQueue
+            inline = await place_orders(client)
+            del app.dependency_overrides[get_job_queue]
+            job_handlers[OrderPlaced] = slow_side_effect
+            queued = await place_orders(client)
+            job_handlers[OrderPlaced] = record_order_placed
+    print(f"order p50 with a {SIDE_EFFECT_SECONDS * 1000:.0f} ms side effect: inline {inline:.2f} ms, queued {queued:.2f} ms")
+    check("shutdown drained the order jobs", job_queue.completed == ORDERS * 2)
+    await dispose_engine()
+
+
+async def main():
+    await check_queue()
+    await check_orders()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
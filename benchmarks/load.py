@@ -0,0 +1,204 @@
+"""In-process load test of the real app against a seeded SQLite database.
+
+Drives each scenario through an ASGI client and reports throughput and
+p50/p95/p99 latency. Results can be saved as a JSON baseline, and later
+runs compared against it. Run from the repository root:
+
+    python -m benchmarks.load --save          # record a baseline
+    python -m benchmarks.load                 # compare against it
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.common import reset_db_file
+
+import httpx
+
+from app import app
+from config.db import SessionLocal, get_engine
+from models.cart import Cart, CartItem
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+from utils.passwords import get_password_hash
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+PRODUCTS = 500
+USERS = 20
+PASSWORD = "bench-password"
+
+
+async def seed():
+    hashed_password = await get_password_hash(PASSWORD)
+    async with SessionLocal(bind=get_engine()) as db:
+        db.add_all([
+            Product(name=f"product {i}", description="benchmark item", price=1 + i % 100, in_stock=i % 5 != 0)
+            for i in range(PRODUCTS)
+        ])
+        users = [
+            User(username=f"user{i}", first_name="f", last_name="l", email=f"user{i}@example.com",
+                 hashed_password=hashed_password, is_admin=i == 0)
+            for i in range(USERS)
+        ]
+        db.add_all(users)
+        await db.flush()
+        db.add_all([Cart(user_id=u.id, items=[CartItem(product_id=1, quantity=1)]) for u in users])
+        await db.commit()
+
+
+class Context:
+    def __init__(self):
+        self.users = [f"user{i}" for i in range(USERS)]
+        self.headers = {name: {"Authorization": f"Bearer {create_access_token({'sub': name})}"} for name in self.users}
+        # Seeded carts and their first item share the user's id
+        self.carts = {name: i + 1 for i, name in enumerate(self.users)}
+
+    def pick(self):
+        name = random.choice(self.users)
+        return name, self.headers[name]
+
+
+async def login(client, ctx):
+    name, _ = ctx.pick()
+    return await client.post("/token/", data={"username": name, "password": PASSWORD})
+
+
+async def list_products(client, ctx):
+    return await client.get("/products/products", params={"limit": 50, "in_stock": True})
+
+
+async def get_product(client, ctx):
+    return await client.get(f"/products/products/{random.randint(1, PRODUCTS)}")
+
+
+async def add_cart_item(client, ctx):
+    name, headers = ctx.pick()
+    item = {"product_id": random.randint(1, PRODUCTS), "quantity": 1}
+    return await client.post(f"/carts/{ctx.carts[name]}/items", json=item, headers=headers)
+
+
+async def update_cart_item(client, ctx):
+    name, headers = ctx.pick()
+    cart_id = ctx.carts[name]
+    return await client.put(f"/carts/{cart_id}/items/{cart_id}", json={"quantity": random.randint(1, 5)}, headers=headers)
+
+
+async def create_order(client, ctx):
+    _, headers = ctx.pick()
+    order = {
+        "user_id": 0,
+        "created_at": datetime.utcnow().isoformat(),
+        "items": [{"product_id": random.randint(1, PRODUCTS), "quantity": 1} for _ in range(3)],
+    }
+    return await client.post("/orders/", json=order, headers=headers)
+
+
+# name -> (scenario, share of the request budget); bcrypt makes logins far slower than the rest
+SCENARIOS = {
+    "login": (login, 0.1),
+    "list_products": (list_products, 1.0),
+    "get_product": (get_product, 1.0),
+    "add_cart_item": (add_cart_item, 1.0),
+    "update_cart_item": (update_cart_item, 1.0),
+    "create_order": (create_order, 1.0),
+}
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, ctx, scenario, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await scenario(client, ctx)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f} < baseline {previous['throughput']:.1f}")
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.2f}ms > baseline {previous['p95_ms']:.2f}ms")
+    return regressions
+
+
+async def main(args):
+    random.seed(args.seed)
+    reset_db_file()
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        await seed()
+        ctx = Context()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in args.scenarios:
+                scenario, share = SCENARIOS[name]
+                requests = max(args.concurrency, int(args.requests * share))
+                results[name] = await run_scenario(client, ctx, scenario, requests, args.concurrency)
+
+    print(f"{'scenario':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        print(f"{name:<18} {result['throughput']:>9.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario before its share is applied")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--baseline", default=BASELINE, help="JSON file to save to or compare against")
+    parser.add_argument("--save", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,83 @@
+"""Database load removed by caching the authenticated principal.
+
+Sends the same stream of authenticated requests with the user cache
+enabled and disabled and reports queries per request and throughput.
+Run from the repository root:
+
+    python -m benchmarks.principal_cache
+"""
+import asyncio
+import time
+
+from benchmarks.common import reset_db_file
+
+import httpx
+from sqlalchemy import event
+
+from app import app
+from config.db import Base, SessionLocal, get_engine
+from models.user import User
+from utils.auth import create_access_token
+from utils.cache import USER_CACHE_TTL, MemoryCache, get_user_cache
+
+engine = get_engine()
+
+USERS = 20
+REQUESTS = 2000
+CONCURRENCY = 20
+
+statements = []
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+async def seed():
+    reset_db_file()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        db.add_all([
+            User(username=f"user{i}", first_name="f", last_name="l", email=f"user{i}@example.com", hashed_password="x")
+            for i in range(USERS)
+        ])
+        await db.commit()
+
+
+async def run(label, cache):
+    app.dependency_overrides[get_user_cache] = lambda: cache
+    tokens = [create_access_token({"sub": f"user{i}"}) for i in range(USERS)]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(n):
+            async with semaphore:
+                # Each user fetches their own profile, one DB read besides authentication
+                response = await client.get(f"/users/{n % USERS + 1}", headers={"Authorization": f"Bearer {tokens[n % USERS]}"})
+                response.raise_for_status()
+
+        statements.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(REQUESTS)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{label:<16} {len(statements) / REQUESTS:5.2f} queries/request  {REQUESTS / elapsed:8.1f} req/s")
+    return len(statements)
+
+
+async def main():
+    await seed()
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+    try:
+        uncached = await run("cache disabled", MemoryCache(0, 0))
+        cached = await run("cache enabled", MemoryCache(USERS, USER_CACHE_TTL))
+    finally:
+        app.dependency_overrides.clear()
+        await engine.dispose()
+    print(f"queries removed: {uncached - cached} of {uncached} ({(uncached - cached) / uncached:.0%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""Per-endpoint SQL query counts at two data sizes.
+
+Every read path should issue a fixed number of queries, so the counts for
+the small and large datasets must match. Exits non-zero if any grow.
+Run from the repository root:
+
+    python -m benchmarks.query_counts
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from benchmarks.common import reset_db_file
+
+import httpx
+from sqlalchemy import event
+
+from app import app
+from config.db import Base, SessionLocal, get_engine
+from models.cart import Cart, CartItem
+from models.order import Order, OrderItem
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+from utils.cache import product_cache, user_cache
+
+engine = get_engine()
+
+SMALL = (2, 2)
+LARGE = (40, 10)
+
+statements = []
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+async def seed(orders: int, items: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionLocal() as db:
+        admin = User(username="admin", first_name="a", last_name="b", email="admin@example.com",
+                     hashed_password="x", is_admin=True)
+        db.add(admin)
+        products = [Product(name=f"p{i}", description="d", price=1 + i, in_stock=True) for i in range(items)]
+        db.add_all(products)
+        await db.flush()
+
+        for _ in range(orders):
+            db.add(Order(user_id=admin.id, total_price=sum(p.price for p in products), created_at=datetime.utcnow(),
+                         items=[OrderItem(product_id=p.id, quantity=1, unit_price=p.price, line_total=p.price)
+                                for p in products]))
+        db.add(Cart(user_id=admin.id, items=[CartItem(product_id=p.id, quantity=1) for p in products]))
+        await db.commit()
+
+    # Seeding bypasses the API, so nothing invalidated the caches
+    await product_cache.invalidate_prefix("")
+    await user_cache.invalidate_prefix("")
+
+
+async def measure(client):
+    endpoints = [
+        ("GET", "/orders/", None),
+        ("GET", "/orders/me", None),
+        ("GET", "/orders/1", None),
+        ("GET", "/carts/1", None),
+        ("PUT", "/carts/1/items/1", {"quantity": 3}),
+        ("GET", "/products/products", None),
+        ("GET", "/products/products?ids=5,3,1,2,4", None),
+        ("GET", "/users/", None),
+    ]
+    counts = {}
+    for method, path, body in endpoints:
+        statements.clear()
+        response = await client.request(method, path, json=body)
+        response.raise_for_status()
+        counts[f"{method} {path}"] = len(statements)
+    return counts
+
+
+async def main():
+    reset_db_file()
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+    token = create_access_token({"sub": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+
+    results = []
+    for orders, items in (SMALL, LARGE):
+        await seed(orders, items)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            results.append(await measure(client))
+    await engine.dispose()
+
+    small, large = results
+    print(f"{'endpoint':<36} {'small':>6} {'large':>6}")
+    failed = False
+    for name in small:
+        flag = "" if small[name] == large[name] else "  <-- grows with rows"
+        failed = failed or bool(flag)
+        print(f"{name:<36} {small[name]:>6} {large[name]:>6}{flag}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,108 @@
+"""Read replica routing with two SQLite files standing in for primary and replica.
+
+Replication is simulated by copying the primary file over the replica.
+Between copies the replica lags, which makes it visible where each read
+went. Checks that:
+
+  - reads go to the replica: other clients don't see a write until it is replicated
+  - the writing client reads its own writes from the primary (sticky cookie)
+  - stickiness ends after REPLICA_STICKY_SECONDS
+  - product pages read from the lagging replica are not cached as current
+
+Exits non-zero on any failed check. Run from the repository root:
+
+    python -m benchmarks.read_replica
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+PRIMARY_DB = os.path.join(tempfile.gettempdir(), "ecommerce_primary.db")
+REPLICA_DB = os.path.join(tempfile.gettempdir(), "ecommerce_replica.db")
+STICKY_SECONDS = 1
+
+os.environ.update(
+    DB_URL_WITHOUT_DB="sqlite:///", DATABASE_NAME=PRIMARY_DB,
+    REPLICA_DB_URL_WITHOUT_DB="sqlite:///", REPLICA_DATABASE_NAME=REPLICA_DB,
+    REPLICA_STICKY_SECONDS=str(STICKY_SECONDS),
+)
+
+from benchmarks.common import reset_db_file
+
+import httpx
+
+from app import app, create_tables
+from config.db import SessionLocal, dispose_engine, get_replica_engine
+from models.product import Product
+from models.user import User
+from utils.auth import create_access_token
+from utils.read_routing import STICKY_COOKIE
+
+failures = []
+
+
+def check(label: str, ok: bool):
+    print(f"{'ok  ' if ok else 'FAIL'} {label}")
+    if not ok:
+        failures.append(label)
+
+
+async def replicate():
+    await get_replica_engine().dispose()
+    shutil.copyfile(PRIMARY_DB, REPLICA_DB)
+
+
+async def seed():
+    reset_db_file(PRIMARY_DB)
+    reset_db_file(REPLICA_DB)
+    await create_tables()
+    async with SessionLocal() as db:
+        db.add(User(username="admin", first_name="f", last_name="l", email="admin@example.com", hashed_password="x",
+                    is_admin=True))
+        db.add(Product(name="first", description="d", price=1, in_stock=True))
+        await db.commit()
+    await replicate()
+
+
+def product_ids(response) -> list:
+    return [p["id"] for p in response.json()["items"]]
+
+
+async def main():
+    await seed()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench.local", headers=headers) as writer, \
+            httpx.AsyncClient(transport=transport, base_url="http://bench.local", headers=headers) as reader:
+        check("replica serves reads", product_ids(await reader.get("/products/products")) == [1])
+
+        created = await writer.post("/products/products", json={"name": "second", "price": 2, "in_stock": True})
+        check("write sets the sticky cookie", STICKY_COOKIE in created.cookies)
+
+        check("writer reads its own write", (await writer.get("/products/products/2")).status_code == 200)
+        check("writer lists its own write", product_ids(await writer.get("/products/products")) == [1, 2])
+        check("other clients read the lagging replica", (await reader.get("/products/products/2")).status_code == 404)
+        check("other clients list the lagging replica", product_ids(await reader.get("/products/products")) == [1])
+
+        await asyncio.sleep(STICKY_SECONDS + 0.2)
+        check("stickiness expires", (await writer.get("/products/products/2")).status_code == 404)
+
+        await replicate()
+        check("replicated write is visible", (await reader.get("/products/products/2")).status_code == 200)
+        check("stale replica page was not cached", product_ids(await reader.get("/products/products")) == [1, 2])
+
+        await writer.post("/orders/", json={"user_id": 1, "created_at": "2024-01-01T00:00:00",
+                                            "items": [{"product_id": 1, "quantity": 1}]})
+        mine = (await writer.get("/orders/me")).json()["items"]
+        theirs = (await reader.get("/orders/me")).json()["items"]
+        check("order history reads the writer's new order", len(mine) == 1 and not theirs)
+
+    await dispose_engine()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
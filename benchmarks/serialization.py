@@ -0,0 +1,107 @@
+"""Bytes per second of the JSON response paths, per response schema.
+
+For a list of ORM rows of each schema in schemas/ it times:
+
+  stdlib     response_model validation, jsonable_encoder and json.dumps
+  pydantic   response_model validation and pydantic's own JSON encoder
+  fast       utils.serialization.dump_json (no validation, orjson)
+
+and checks that the fast path produces exactly the pydantic bytes. Exits
+non-zero on any difference. Run from the repository root:
+
+    python -m benchmarks.serialization
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+import benchmarks.common  # noqa: F401  (environment defaults)
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models.cart import Cart, CartItem
+from models.order import Order, OrderItem
+from models.product import Product
+from models.user import User
+from schemas.cart import CartOut
+from schemas.order import OrderOut
+from schemas.product import ProductOut
+from schemas.user import UserOut
+from utils.serialization import dump_json
+
+ROWS = 2000
+ITEMS = 5
+REPEAT = 5
+
+
+# Stored rows keep in_stock in line with stock when it is tracked, writes make sure of it
+def products():
+    return [
+        Product(id=i, name=f"Product {i}", description="A fairly ordinary product description",
+                price=Decimal("19.99") + i, in_stock=i % 3 != 0 if i % 2 else i % 5 > 0, stock=None if i % 2 else i % 5)
+        for i in range(ROWS)
+    ]
+
+
+def users():
+    start = datetime(2024, 1, 1)
+    return [
+        User(id=i, username=f"user{i}", first_name="First", last_name="Last", email=f"user{i}@example.com",
+             created_at=start + timedelta(minutes=i, microseconds=i), is_admin=False)
+        for i in range(ROWS)
+    ]
+
+
+def orders():
+    start = datetime(2024, 1, 1)
+    return [
+        Order(id=i, user_id=i % 50, total_price=Decimal("59.97"), status="pending",
+              created_at=start + timedelta(minutes=i),
+              items=[OrderItem(id=i * ITEMS + n, order_id=i, product_id=n, quantity=3,
+                               unit_price=Decimal("19.99"), line_total=Decimal("59.97")) for n in range(ITEMS)])
+        for i in range(ROWS)
+    ]
+
+
+def carts():
+    return [
+        Cart(id=i, user_id=i, items=[CartItem(id=i * ITEMS + n, cart_id=i, product_id=n, quantity=1) for n in range(ITEMS)])
+        for i in range(ROWS)
+    ]
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return body, min(timings)
+
+
+def main():
+    print(f"{'schema':<12} {'path':<10} {'MB/s':>8} {'ms':>8}  ({ROWS} rows)")
+    failed = False
+    for schema, rows in ((ProductOut, products()), (UserOut, users()), (OrderOut, orders()), (CartOut, carts())):
+        adapter = TypeAdapter(List[schema])
+        paths = {
+            "stdlib": lambda: json.dumps(jsonable_encoder(adapter.validate_python(rows, from_attributes=True))).encode(),
+            "pydantic": lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True)),
+            "fast": lambda: dump_json(schema, rows, many=True),
+        }
+        results = {name: best_of(fn) for name, fn in paths.items()}
+        for name, (body, seconds) in results.items():
+            print(f"{schema.__name__:<12} {name:<10} {len(body) / seconds / 1e6:8.1f} {seconds * 1000:8.2f}")
+
+        if results["fast"][0] != results["pydantic"][0]:
+            failed = True
+            print(f"{schema.__name__}: fast path output differs from the response_model output")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Payload size and encode time per wire format and compression.
+
+Encodes a realistic catalog page and an order history, the way the API
+does: schema serializer, then JSON (orjson) or MessagePack, then gzip or
+brotli at the levels the compression middleware uses. Run from the
+repository root:
+
+    python -m benchmarks.wire_formats
+"""
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import benchmarks.common  # noqa: F401  (environment defaults)
+
+import brotli
+import msgpack
+import orjson
+
+from models.order import Order, OrderItem
+from models.product import Product
+from models.user import User  # noqa: F401  (configures Order.user)
+from schemas.order import OrderOut
+from schemas.product import ProductOut
+from utils.compression import BROTLI_QUALITY, COMPRESSION_MIN_SIZE, GZIP_LEVEL
+from utils.serialization import _msgpack_default, serialize
+
+PRODUCTS = 200
+ORDERS = 100
+REPEAT = 20
+
+WORDS = (
+    "organic cotton slim fit shirt wireless noise cancelling headphones stainless steel water bottle "
+    "leather wallet running shoes lightweight breathable mesh ceramic coffee mug handmade wooden "
+    "desk lamp adjustable brightness usb charger fast charging waterproof hiking backpack"
+).split()
+
+
+def catalog():
+    rng = random.Random(1)
+    return [
+        Product(id=i, name=" ".join(rng.choices(WORDS, k=3)).title(), description=" ".join(rng.choices(WORDS, k=18)),
+                price=Decimal(rng.randint(199, 19999)) / 100, in_stock=rng.random() > 0.2,
+                stock=rng.choice([None, rng.randint(0, 500)]))
+        for i in range(1, PRODUCTS + 1)
+    ]
+
+
+def history():
+    rng = random.Random(2)
+    start = datetime(2024, 1, 1)
+    orders = []
+    for i in range(1, ORDERS + 1):
+        items = [
+            OrderItem(id=i * 10 + n, order_id=i, product_id=rng.randint(1, PRODUCTS), quantity=rng.randint(1, 3),
+                      unit_price=Decimal("24.99"), line_total=Decimal("49.98"))
+            for n in range(rng.randint(1, 5))
+        ]
+        orders.append(Order(id=i, user_id=7, total_price=sum(item.line_total for item in items), status="delivered",
+                            created_at=start + timedelta(days=i, seconds=rng.randint(0, 86400)), items=items))
+    return orders
+
+
+FORMATS = {
+    "json": orjson.dumps,
+    "msgpack": lambda data: msgpack.packb(data, default=_msgpack_default),
+}
+COMPRESSIONS = {
+    "none": lambda body: body,
+    f"gzip-{GZIP_LEVEL}": lambda body: gzip.compress(body, GZIP_LEVEL),
+    f"br-{BROTLI_QUALITY}": lambda body: brotli.compress(body, quality=BROTLI_QUALITY),
+}
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return body, min(timings)
+
+
+def report(label, schema, rows, many=True):
+    print(f"\n{label}")
+    print(f"{'format':<10} {'compression':<12} {'bytes':>9} {'ratio':>7} {'encode ms':>10}")
+    baseline = None
+    for format_name, encode in FORMATS.items():
+        for compression_name, compress in COMPRESSIONS.items():
+            body, seconds = best_of(lambda: compress(encode(serialize(schema, rows, many))))
+            baseline = baseline or len(body)
+            print(f"{format_name:<10} {compression_name:<12} {len(body):>9} {len(body) / baseline:>7.2f} {seconds * 1000:>10.3f}")
+
+
+def main():
+    products = catalog()
+    report(f"catalog page, {PRODUCTS} products", ProductOut, products)
+    report(f"order history, {ORDERS} orders", OrderOut, history())
+    report("single product (the middleware leaves bodies under "
+           f"{COMPRESSION_MIN_SIZE} bytes uncompressed)", ProductOut, products[0], many=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, String, Table, event, text, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-import pymysql
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextvars import ContextVar
+from fastapi import Depends
 from dotenv import load_dotenv
+import logging
 import os
+import re
+import time
 
 load_dotenv()
 
@@ -14,27 +21,266 @@ DATABASE_NAME = os.getenv("DATABASE_NAME")
 
 DATABASE_URL = f"{DB_URL_WITHOUT_DB}{DATABASE_NAME}"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Optional read replica for read-only handlers, e.g. mysql+pymysql://reader:pw@replica-host/ or
+# sqlite:/// with REPLICA_DATABASE_NAME pointing at a copy of the database file
+REPLICA_DB_URL_WITHOUT_DB = os.getenv("REPLICA_DB_URL_WITHOUT_DB")
+REPLICA_DATABASE_NAME = os.getenv("REPLICA_DATABASE_NAME", DATABASE_NAME)
+REPLICA_DATABASE_URL = f"{REPLICA_DB_URL_WITHOUT_DB}{REPLICA_DATABASE_NAME}" if REPLICA_DB_URL_WITHOUT_DB else None
+
+# After a write, the same client reads from the primary for this long, to cover replication lag
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+# Sync drivers in the configured URLs are swapped for their asyncio counterparts
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+# Pool settings, recycle should stay below MySQL's wait_timeout
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+pool_metrics = PoolMetrics()
+
+
+# Queue pool that records how long each checkout waited and how many timed out.
+# Timed out checkouts are only counted as timeouts, so they don't inflate the wait figures.
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+slow_query_log = logging.getLogger("sql.slow")
+
+
+# Queries issued while serving one request, see utils/query_stats.py
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.budget = None
+
+
+current_query_stats: ContextVar = ContextVar("current_query_stats", default=None)
+
+
+# Collapse whitespace and IN lists so the same query always logs the same way
+def normalize_sql(statement: str) -> str:
+    statement = re.sub(r"\s+", " ", statement).strip()
+    return re.sub(r"IN \((?:\?|%s)(?:, ?(?:\?|%s))*\)", "IN (...)", statement)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"]
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_log.warning("slow query (%.1f ms): %s", elapsed * 1000, normalize_sql(statement))
+
+
+def instrument_engine(engine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+# Sessions are bound on first use, together with the engine
+SessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+_engine = None
+_replica_engine = None
+
+
+def create_pooled_engine(url: str):
+    engine = create_async_engine(
+        to_async_url(url),
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    return instrument_engine(engine)
+
+
+# The engine (and its driver import) is created lazily to keep cold starts short
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_pooled_engine(DATABASE_URL)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+# The replica engine, or the primary when no replica is configured
+def get_replica_engine():
+    global _replica_engine
+    if REPLICA_DATABASE_URL is None:
+        return get_engine()
+    if _replica_engine is None:
+        _replica_engine = create_pooled_engine(REPLICA_DATABASE_URL)
+    return _replica_engine
+
+
+async def dispose_engine():
+    if _engine is not None:
+        await _engine.dispose()
+    if _replica_engine is not None:
+        await _replica_engine.dispose()
+
+
+# Where this request's reads go, see utils/read_routing.py
+class ReadRouting:
+    def __init__(self, use_primary: bool):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+current_read_routing: ContextVar = ContextVar("current_read_routing", default=None)
+
+
+@event.listens_for(Session, "after_commit")
+def _record_write(session):
+    routing = current_read_routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+
+# Engine for read-only work: the replica, unless this client wrote recently and must see its own writes
+def get_read_engine():
+    routing = current_read_routing.get()
+    if routing is not None and routing.use_primary:
+        return get_engine()
+    return get_replica_engine()
+
 
 Base = declarative_base()
 
-def create_database():
-    try: 
-        engine_without_db = create_engine(DB_URL_WITHOUT_DB)
-        connection = engine_without_db.connect()
-        connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {DATABASE_NAME}"))
-        connection.close()
+# Bump whenever tables are added or changed, so startup bootstraps the schema again
+SCHEMA_VERSION = "6"
+FAST_STARTUP = os.getenv("FAST_STARTUP", "true").lower() in ("1", "true", "yes")
+
+schema_version = Table("schema_version", Base.metadata, Column("version", String(32), nullable=False))
+
+
+async def create_database():
+    # SQLite creates the database file on first connect
+    if make_url(DATABASE_URL).get_backend_name() == "sqlite":
+        return
+    import pymysql
+
+    try:
+        engine_without_db = create_async_engine(to_async_url(DB_URL_WITHOUT_DB))
+        async with engine_without_db.connect() as connection:
+            await connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {DATABASE_NAME}"))
+        await engine_without_db.dispose()
         print("Database created successfully")
     except pymysql.MySQLError as e:
         print(f"Error creating database: {e}")
         raise
-    
 
 
-def get_db():
-    db = SessionLocal()
+async def schema_is_current() -> bool:
     try:
+        async with get_engine().connect() as connection:
+            version = await connection.scalar(schema_version.select().with_only_columns(schema_version.c.version))
+    except exc.DBAPIError:
+        # Missing database or marker table
+        return False
+    return version == SCHEMA_VERSION
+
+
+async def mark_schema_current(connection):
+    await connection.execute(schema_version.delete())
+    await connection.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+
+
+
+def pool_usage(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+
+
+# Checkout waits and timeouts are counted over both pools
+def pool_stats() -> dict:
+    stats = {
+        **pool_usage(get_engine().pool),
+        "checkouts": pool_metrics.checkouts,
+        "timeouts": pool_metrics.timeouts,
+        "wait_seconds_total": pool_metrics.wait_seconds_total,
+        "wait_seconds_max": pool_metrics.wait_seconds_max,
+    }
+    if REPLICA_DATABASE_URL is not None:
+        stats["replica"] = pool_usage(get_replica_engine().pool)
+    return stats
+
+
+# Set while a batch request runs its sub-requests, they all use its session and so its connection
+batch_session: ContextVar = ContextVar("batch_session", default=None)
+
+
+async def get_db():
+    db = batch_session.get()
+    if db is not None:
+        yield db
+        return
+    async with SessionLocal(bind=get_engine()) as db:
+        yield db
+
+
+# For handlers that only read, they may see data a replication lag behind other clients' writes.
+# Without a replica it is the request's primary session, so auth and the handler share a connection.
+async def get_read_db(db: AsyncSession = Depends(get_db)):
+    engine = get_read_engine()
+    if batch_session.get() is not None or engine is get_engine():
         yield db
-    finally:
-        db.close()
+        return
+    async with SessionLocal(bind=engine) as read_db:
+        yield read_db
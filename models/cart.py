@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from config.db import Base
 
@@ -10,7 +10,7 @@ class Cart(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
 
     user = relationship("User", back_populates="cart")
-    items = relationship("CartItem", back_populates="cart")
+    items = relationship("CartItem", back_populates="cart", lazy="raise_on_sql")
 
 
 class CartItem(Base):
@@ -21,5 +21,10 @@ class CartItem(Base):
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
 
-    cart = relationship("Cart", back_populates="items")
-    product = relationship("Product")
\ No newline at end of file
+    cart = relationship("Cart", back_populates="items", lazy="raise_on_sql")
+    product = relationship("Product")
+
+    # One row per product in a cart, adding it again increments the quantity. Also serves lookups by cart_id.
+    __table_args__ = (
+        Index("uq_cart_items_cart_product", "cart_id", "product_id", unique=True),
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, Numeric, String, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.db import Base
@@ -10,22 +10,31 @@ class Order(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    total_price = Column(Float, nullable=False)
+    # Sum of the items' line totals, computed when the order is placed
+    total_price = Column(Numeric(10, 2), nullable=False)
     status = Column(String(50), default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order",
-                         cascade="all, delete-orphan")
+                         cascade="all, delete-orphan", lazy="raise_on_sql")
+
+    # Serves a user's order history, newest first
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    )
 
 class OrderItem(Base):
     __tablename__ = 'order_items'
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
+    # Snapshot of the product price when the order was placed, later price changes don't affect it
+    unit_price = Column(Numeric(10, 2), nullable=False)
+    line_total = Column(Numeric(10, 2), nullable=False)
 
     # Relationships
     order = relationship("Order", back_populates="items")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Numeric 
+from sqlalchemy import Column, Integer, String, Boolean, Numeric, Index
 from sqlalchemy.ext.declarative import declarative_base
 from config.db import Base
 
@@ -13,5 +13,12 @@ class Product(Base):
     description = Column(String(255), nullable=True)
     price = Column(Numeric(10, 2), nullable=False)
     in_stock = Column(Boolean, default=True)
+    # Units available, NULL when inventory is not tracked for the product. See utils/inventory.py.
+    stock = Column(Integer, nullable=True)
+
+    # Full-text search on MySQL, other databases use the in-process index in utils/search.py
+    __table_args__ = (
+        Index("ix_products_fulltext", "name", "description", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
 
 
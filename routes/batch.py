@@ -0,0 +1,152 @@
+import logging
+import orjson
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.exceptions import HTTPException
+from starlette.routing import Match
+from typing import Optional
+from urllib.parse import urlsplit
+from config.db import QueryStats, batch_session, current_query_stats, get_db
+from routes.cart import cart
+from routes.metrics import metrics
+from routes.order import order
+from routes.product import product
+from routes.stats import stats
+from routes.token import router as token
+from routes.user import user
+from schemas.batch import BatchRequest, BatchResponse
+from schemas.user import UserOut
+from utils.auth import batch_user, get_optional_user
+from utils.serialization import JSON, negotiate_format, payload_response, response_format
+
+batch = APIRouter(tags=["batch"], dependencies=[Depends(negotiate_format)])
+
+logger = logging.getLogger("batch")
+
+# Only the headers a read handler looks at are passed on to the sub-requests
+FORWARDED_HEADERS = (b"authorization", b"cookie")
+
+# Read routes that answer with one JSON body. Streaming routes such as /orders/export are left
+# out, their body would be buffered whole in the batch response.
+BATCH_ROUTES = {
+    "/products/products",
+    "/products/products/search",
+    "/products/products/{product_id}",
+    "/orders/",
+    "/orders/me",
+    "/orders/{order_id}",
+    "/carts/{cart_id}",
+    "/users/",
+    "/users/{user_id}",
+}
+
+
+# Path template of the route the app would pick for this scope, None when nothing matches.
+# Routers are searched in the order app.py includes them.
+def matched_route(scope) -> Optional[str]:
+    for route in (*user.routes, *product.routes, *order.routes, *cart.routes, *token.routes, *stats.routes, *metrics.routes):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return None
+
+
+# Run one GET through the router, skipping the middleware, and collect what it sends
+async def dispatch(request: Request, path: str):
+    url = urlsplit(path)
+    headers = [(name, value) for name, value in request.scope["headers"] if name in FORWARDED_HEADERS]
+    headers.append((b"accept", JSON.encode()))
+    scope = {
+        **request.scope,
+        "method": "GET",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers,
+    }
+    for key in ("route", "endpoint", "path_params", "fastapi_inner_astack", "fastapi_function_astack"):
+        scope.pop(key, None)
+
+    route = matched_route(scope)
+    if route is None:
+        return 404, {"detail": "Not Found"}
+    if route not in BATCH_ROUTES:
+        return 400, {"detail": f"GET {route} can't be part of a batch"}
+
+    status = 500
+    chunks = []
+    content_type = ""
+    received = False
+
+    # The empty body, then a disconnect, so nothing waiting on the client loops forever
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            content_type = dict(message.get("headers", [])).get(b"content-type", b"").decode()
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except HTTPException as e:
+        # Raised outside the route, normally answered by the app's exception middleware, which sub-requests skip
+        return e.status_code, {"detail": e.detail}
+
+    body = b"".join(chunks)
+    if not body:
+        return status, None
+    if content_type.startswith(JSON):
+        return status, orjson.loads(body)
+    return status, body.decode()
+
+
+# Run several GET requests in one round trip. They share this request's session, so one
+# connection, and its token check. Each result has the status and body the request would have had.
+@batch.post("/batch", response_model=BatchResponse)
+async def run_batch(
+    request: Request,
+    batch_data: BatchRequest,
+    current_user: Optional[UserOut] = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_db)
+):
+    stats = current_query_stats.get()
+    responses = []
+
+    session_token = batch_session.set(db)
+    user_token = batch_user.set(current_user)
+    format_token = response_format.set(JSON)
+    try:
+        for sub_request in batch_data.requests:
+            # Per request budgets apply to each sub-request, the batch itself has none
+            sub_stats = QueryStats()
+            stats_token = current_query_stats.set(sub_stats)
+            try:
+                status, body = await dispatch(request, sub_request.path)
+            except Exception:
+                logger.exception("batch sub-request failed: GET %s", sub_request.path)
+                await db.rollback()
+                status, body = 500, {"detail": "Internal Server Error"}
+            finally:
+                current_query_stats.reset(stats_token)
+
+            if stats is not None:
+                stats.count += sub_stats.count
+                stats.seconds += sub_stats.seconds
+            if sub_stats.budget is not None and sub_stats.count > sub_stats.budget:
+                logger.warning("query budget exceeded: GET %s ran %d queries, budget is %d",
+                               sub_request.path, sub_stats.count, sub_stats.budget)
+            responses.append({"status": status, "body": body})
+    finally:
+        response_format.reset(format_token)
+        batch_user.reset(user_token)
+        batch_session.reset(session_token)
+
+    return payload_response({"responses": responses})
@@ -1,55 +1,80 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import DateTime, func, literal, select, delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload
+from typing import Dict, List, Literal
+from datetime import datetime
 from config.db import get_db
 from models.cart import Cart as CartModel, CartItem as CartItemModel
+from models.order import Order as OrderModel, OrderItem as OrderItemModel
 from models.product import Product as ProductModel
-from models.user import User as UserModel
-from schemas.cart import CartCreate,  CartOut, CartItemCreate, CartItemOut, CartItemUpdate
+from schemas.order import OrderOut
+from schemas.user import UserOut
+from schemas.cart import CartCreate,  CartOut, CartItemCreate, CartItemOut, CartItemsBatch, CartItemUpdate
 from utils.auth import get_current_user
+from utils.query_stats import query_budget
+from utils.cache import CacheBackend, get_product_cache
+from utils.inventory import ensure_products_exist, reserve_cart_stock, stock_changed
+from utils.jobs import JobQueue, get_job_queue
+from utils.search import ProductSearchIndex, get_product_search_index
+from utils.order_jobs import OrderPlaced
+from utils.upsert import upsert
+from utils.serialization import encoded_response, negotiate_format, payload_response
 
 
-cart = APIRouter(prefix="/carts", tags=["carts"])
+cart = APIRouter(prefix="/carts", tags=["carts"], dependencies=[Depends(negotiate_format)])
 
 
-# Create cart
-@cart.post("/", response_model=CartOut)
-async def create_cart(cart_data: CartCreate, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+# A cart holds one row per product, so repeated products are merged by summing their quantities
+def merge_quantities(items: List[CartItemCreate]) -> Dict[int, int]:
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+# Insert the items or, for products already in the cart, add to (or replace) their quantity, in one statement
+async def upsert_cart_items(db: AsyncSession, cart_id: int, quantities: Dict[int, int], mode: str = "add"):
+    statement = upsert(
+        db.get_bind().dialect.name, CartItemModel, ["cart_id", "product_id"],
+        lambda new: {"quantity": CartItemModel.quantity + new.quantity if mode == "add" else new.quantity}
+    )
+    await db.execute(statement, [
+        {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ])
+
+
+# Create cart, items are validated and inserted in the same transaction
+@cart.post("/", response_model=CartOut, dependencies=[Depends(query_budget(6))])
+async def create_cart(cart_data: CartCreate, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
 
     if cart_data.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to create cart for this user")
 
+    await ensure_products_exist(db, (item.product_id for item in cart_data.items))
+
     db_cart = CartModel(
         user_id=current_user.id
     )
     db.add(db_cart)
-    db.commit()
-    db.refresh(db_cart)
-
-    
-    for item_data in cart_data.items:
-        product = db.query(ProductModel).filter(ProductModel.id == item_data.product_id).first()
-
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item_data.product_id} not found")
-
-        cart_item = CartItemModel(
-            cart_id=db_cart.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity
-        )
-        db.add(cart_item)
-        db.commit() 
-        db.refresh(cart_item) 
-    
-    return db_cart  
+    await db.flush()
 
+    # One executemany for all cart items
+    if cart_data.items:
+        await db.execute(insert(CartItemModel), [
+            {"cart_id": db_cart.id, "product_id": product_id, "quantity": quantity}
+            for product_id, quantity in merge_quantities(cart_data.items).items()
+        ])
 
+    await db.refresh(db_cart, ["items"])
+    await db.commit()
 
+    return encoded_response(CartOut, db_cart)
 # Get cart (user and admin)
-@cart.get("/{cart_id}", response_model=CartOut)
-async def get_cart(cart_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_cart = db.query(CartModel).filter(CartModel.id == cart_id).first()
+@cart.get("/{cart_id}", response_model=CartOut, dependencies=[Depends(query_budget(2))])
+async def get_cart(cart_id: int, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_cart = await db.get(CartModel, cart_id, options=[joinedload(CartModel.items)])
 
     if not db_cart:
         raise HTTPException(status_code=404, detail="Cart not found")
@@ -58,13 +83,13 @@ async def get_cart(cart_id: int, current_user: UserModel = Depends(get_current_u
     if db_cart.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to view this cart")
     
-    return db_cart
+    return encoded_response(CartOut, db_cart)
 
 
-# Add item to an existing cart
-@cart.post("/{cart_id}/items", response_model=CartItemOut)
-async def add_item_to_cart(cart_id: int, item_data: CartItemCreate, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_cart = db.query(CartModel).filter(CartModel.id == cart_id).first()
+# Add item to an existing cart, a product already in the cart gets its quantity increased
+@cart.post("/{cart_id}/items", response_model=CartItemOut, dependencies=[Depends(query_budget(5))])
+async def add_item_to_cart(cart_id: int, item_data: CartItemCreate, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_cart = await db.get(CartModel, cart_id)
 
     if not db_cart:
         raise HTTPException(status_code=404, detail="Cart not found")
@@ -73,30 +98,62 @@ async def add_item_to_cart(cart_id: int, item_data: CartItemCreate, current_user
     if db_cart.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to add items to this cart")
     
-    product = db.query(ProductModel).filter(ProductModel.id == item_data.product_id).first()
+    product = await db.get(ProductModel, item_data.product_id)
 
     if not product:
         raise HTTPException(status_code=404, detail=f"Product {item_data.product_id} not found")
     
-
-    cart_item = CartItemModel(
-        cart_id = db_cart.id,
-        product_id = item_data.product_id,
-        quantity = item_data.quantity
+    await upsert_cart_items(db, db_cart.id, {item_data.product_id: item_data.quantity})
+    cart_item = await db.scalar(
+        select(CartItemModel)
+        .where(CartItemModel.cart_id == db_cart.id, CartItemModel.product_id == item_data.product_id)
+        .execution_options(populate_existing=True)
     )
+    await db.commit()
+
+    return encoded_response(CartItemOut, cart_item)
+
 
-    db.add(cart_item)
-    db.commit()
-    db.refresh(cart_item)
+# Add or update many items in one request. mode=add increments quantities, mode=set replaces them.
+@cart.post("/{cart_id}/items/batch", response_model=CartOut, dependencies=[Depends(query_budget(6))])
+async def add_items_to_cart(
+    cart_id: int,
+    batch: CartItemsBatch,
+    mode: Literal["add", "set"] = "add",
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    db_cart = await db.get(CartModel, cart_id)
 
-    return cart_item
+    if not db_cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+
+    if db_cart.user_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized to add items to this cart")
 
+    await ensure_products_exist(db, (item.product_id for item in batch.items))
 
+    if batch.items:
+        if mode == "add":
+            quantities = merge_quantities(batch.items)
+        else:
+            quantities = {item.product_id: item.quantity for item in batch.items}
+        await upsert_cart_items(db, db_cart.id, quantities, mode)
+
+    await db.refresh(db_cart, ["items"])
+    await db.commit()
+
+    return encoded_response(CartOut, db_cart)
 # Update cart item (user and admin)
-@cart.put("/{cart_id}/items/{item_id}", response_model=CartOut)
-async def update_cart_item(cart_id: int, item_id: int, item_data: CartItemUpdate, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+@cart.put("/{cart_id}/items/{item_id}", response_model=CartOut, dependencies=[Depends(query_budget(5))])
+async def update_cart_item(cart_id: int, item_id: int, item_data: CartItemUpdate, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     
-    cart_item = db.query(CartItemModel).filter(CartItemModel.id == item_id, CartItemModel.cart_id == cart_id).first()
+    cart_item = await db.scalar(
+        select(CartItemModel)
+        .join(CartItemModel.cart)
+        .options(contains_eager(CartItemModel.cart))
+        .where(CartItemModel.id == item_id, CartItemModel.cart_id == cart_id)
+    )
 
     if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
@@ -108,20 +165,94 @@ async def update_cart_item(cart_id: int, item_id: int, item_data: CartItemUpdate
         cart_item.quantity = item_data.quantity
 
 
-    db.commit()
-    db.refresh(cart_item)
+    await db.commit()
 
-    
-    db_cart = db.query(CartModel).filter(CartModel.id == cart_id).first()
+    db_cart = cart_item.cart
+    await db.refresh(db_cart, ["items"])
+
+    return encoded_response(CartOut, db_cart)
+# Cart lines priced at the current product price, items whose product no longer exists are left out
+def priced_cart_lines(cart_id: int):
+    return (
+        select(CartItemModel.product_id, CartItemModel.quantity, ProductModel.price)
+        .join(ProductModel, ProductModel.id == CartItemModel.product_id)
+        .where(CartItemModel.cart_id == cart_id)
+        .subquery()
+    )
 
-    return db_cart
+
+# Turn the cart into an order in one transaction: stock is reserved, the order, its items and its
+# total are built with INSERT ... SELECT from cart_items, then the cart is emptied. The cart row is
+# locked first, so a concurrent checkout of the same cart waits and then finds it empty. A no-op
+# UPDATE takes that lock on MySQL and SQLite alike, where SELECT ... FOR UPDATE is ignored.
+@cart.post("/{cart_id}/checkout", response_model=OrderOut, dependencies=[Depends(query_budget(10))])
+async def checkout_cart(
+    cart_id: int,
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    jobs: JobQueue = Depends(get_job_queue),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    await db.execute(update(CartModel).where(CartModel.id == cart_id).values(user_id=CartModel.user_id))
+    db_cart = await db.get(CartModel, cart_id)
+
+    if not db_cart:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Cart not found")
+
+    if db_cart.user_id != current_user.id and not current_user.is_admin:
+        await db.rollback()
+        raise HTTPException(status_code=403, detail="Not authorized to check out this cart")
+
+    lines = priced_cart_lines(cart_id)
+    product_ids = (await db.scalars(select(lines.c.product_id))).all()
+    line_count = len(product_ids)
+
+    if line_count == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    await reserve_cart_stock(db, cart_id, line_count)
+
+    result = await db.execute(
+        insert(OrderModel).from_select(
+            ["user_id", "total_price", "status", "created_at"],
+            select(
+                literal(db_cart.user_id), func.sum(lines.c.price * lines.c.quantity),
+                literal("pending"), literal(datetime.utcnow(), DateTime)
+            )
+        )
+    )
+    order_id = result.lastrowid
+
+    await db.execute(
+        insert(OrderItemModel).from_select(
+            ["order_id", "product_id", "quantity", "unit_price", "line_total"],
+            select(literal(order_id), lines.c.product_id, lines.c.quantity, lines.c.price, lines.c.price * lines.c.quantity)
+        )
+    )
+    await db.execute(delete(CartItemModel).where(CartItemModel.cart_id == cart_id))
+    await db.commit()
+    await stock_changed(db, cache, search_index, product_ids)
+
+    db_order = await db.get(OrderModel, order_id, options=[joinedload(OrderModel.items)])
+    await jobs.enqueue(OrderPlaced(
+        order_id=order_id, user_id=db_order.user_id, total_price=db_order.total_price, items=line_count
+    ))
+    return encoded_response(OrderOut, db_order)
 
 
 #  Remove item from cart
 @cart.delete("/{cart_id}/items/{item_id}", response_model=dict)
-async def remove_cart_item(cart_id: int, item_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+async def remove_cart_item(cart_id: int, item_id: int, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
 
-    cart_item = db.query(CartItemModel).filter(CartItemModel.id == item_id, CartItemModel.cart_id == cart_id).first()
+    cart_item = await db.scalar(
+        select(CartItemModel)
+        .join(CartItemModel.cart)
+        .options(contains_eager(CartItemModel.cart))
+        .where(CartItemModel.id == item_id, CartItemModel.cart_id == cart_id)
+    )
 
     if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
@@ -129,16 +260,16 @@ async def remove_cart_item(cart_id: int, item_id: int, current_user: UserModel =
     if cart_item.cart.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to delete this cart item")
 
-    db.delete(cart_item)
-    db.commit()
-    return {"message": "The item has been removed from the cart"}
+    await db.delete(cart_item)
+    await db.commit()
+    return payload_response({"message": "The item has been removed from the cart"})
     
 
 # Delete a user's cart
 @cart.delete("/{cart_id}", response_model=dict)
-async def delete_cart(cart_id: int,current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_cart(cart_id: int,current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     
-    db_cart = db.query(CartModel).filter(CartModel.id == cart_id).first()
+    db_cart = await db.get(CartModel, cart_id)
 
     if not db_cart:
         raise HTTPException(status_code=404, detail="Cart not found")
@@ -146,7 +277,7 @@ async def delete_cart(cart_id: int,current_user: UserModel = Depends(get_current
     if db_cart.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to delete this cart")
 
-    db.query(CartItemModel).filter(CartItemModel.cart_id == cart_id).delete()
-    db.delete(db_cart)
-    db.commit()
-    return {"message": "Cart deleted"}
+    await db.execute(delete(CartItemModel).where(CartItemModel.cart_id == cart_id))
+    await db.delete(db_cart)
+    await db.commit()
+    return payload_response({"message": "Cart deleted"})
@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from config.db import pool_stats
+from utils.cache import product_cache, user_cache
+from utils.metrics import render_metric, request_metrics
+
+metrics = APIRouter(tags=["metrics"])
+
+
+def render_pool_metrics() -> str:
+    stats = pool_stats()
+    return "".join([
+        render_metric("db_pool_size", "gauge", "Configured connection pool size.", [({}, stats["size"])]),
+        render_metric("db_pool_checked_out", "gauge", "Connections currently checked out.", [({}, stats["checked_out"])]),
+        render_metric("db_pool_overflow", "gauge", "Overflow connections currently open.", [({}, stats["overflow"])]),
+        render_metric("db_pool_checkouts_total", "counter", "Connection checkouts.", [({}, stats["checkouts"])]),
+        render_metric("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.", [({}, stats["timeouts"])]),
+        render_metric("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", [({}, stats["wait_seconds_total"])]),
+    ])
+
+
+def render_cache_metrics() -> str:
+    caches = {"product": product_cache.stats(), "user": user_cache.stats()}
+    return "".join(
+        render_metric(metric, kind, help_text, [({"cache": name}, stats[field]) for name, stats in caches.items()])
+        for metric, field, kind, help_text in (
+            ("cache_entries", "entries", "gauge", "Entries currently cached."),
+            ("cache_hits_total", "hits", "counter", "Cache hits."),
+            ("cache_misses_total", "misses", "counter", "Cache misses."),
+            ("cache_evictions_total", "evictions", "counter", "Entries evicted to stay within the size bound."),
+        )
+    )
+
+
+# Prometheus scrape endpoint
+@metrics.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    body = request_metrics.render() + render_pool_metrics() + render_cache_metrics()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -1,61 +1,231 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from config.db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Literal, Optional
+from datetime import datetime
+from decimal import Decimal
+import os
+from config.db import get_db, get_read_db, get_read_engine
 from models.order import Order as OrderModel, OrderItem as OrderItemModel
-from schemas.order import OrderCreate, OrderUpdate, OrderOut, OrderItemCreate, OrderItemOut
-from models.product import Product as ProductModel
-from models.user import User as UserModel
+from schemas.order import OrderCreate, OrderUpdate, OrderOut, OrderPage
+from schemas.user import UserOut
 from utils.auth import get_current_user, is_admin_user
-
-
-order = APIRouter(prefix="/orders", tags=["orders"])
-
-
-# Create a new order
-@order.post("/", response_model=OrderOut)
-async def create_order(order_data: OrderCreate,current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+from utils.query_stats import query_budget
+from utils.cache import CacheBackend, get_product_cache
+from utils.inventory import (
+    get_product_prices, holds_stock, order_quantities, release_order_stock, reserve_stock, stock_changed
+)
+from utils.jobs import JobQueue, get_job_queue
+from utils.search import ProductSearchIndex, get_product_search_index
+from utils.order_jobs import OrderPlaced
+from utils.streaming import csv_line
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, build_page, decode_cursor
+from utils.serialization import dump_json, encoded_response, negotiate_format, payload_response
+
+
+order = APIRouter(prefix="/orders", tags=["orders"], dependencies=[Depends(negotiate_format)])
+
+ORDER_EXPORT_CHUNK_SIZE = int(os.getenv("ORDER_EXPORT_CHUNK_SIZE", "1000"))
+ORDER_EXPORT_CSV_COLUMNS = (
+    "order_id", "user_id", "status", "created_at", "total_price", "item_id", "product_id", "quantity", "unit_price", "line_total"
+)
+
+
+# Create a new order, items are validated and inserted in the same transaction.
+# Items snapshot the current product prices and the total is computed from them.
+# Stock is reserved first, so the product rows are locked before the order items' foreign key
+# checks take shared locks on them, which could otherwise deadlock concurrent orders on MySQL.
+# Side effects run as background jobs once the order is committed.
+@order.post("/", response_model=OrderOut, dependencies=[Depends(query_budget(8))])
+async def create_order(
+    order_data: OrderCreate,
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    jobs: JobQueue = Depends(get_job_queue),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+
+    prices = await get_product_prices(db, (item.product_id for item in order_data.items))
+    lines = [
+        {
+            "product_id": item.product_id,
+            "quantity": item.quantity,
+            "unit_price": prices[item.product_id],
+            "line_total": prices[item.product_id] * item.quantity,
+        }
+        for item in order_data.items
+    ]
+
+    quantities = {}
+    for line in lines:
+        quantities[line["product_id"]] = quantities.get(line["product_id"], 0) + line["quantity"]
+    await reserve_stock(db, quantities)
 
     db_order = OrderModel(
         user_id=current_user.id, 
-        total_price=order_data.total_price,
+        total_price=sum((line["line_total"] for line in lines), Decimal("0")),
         status=order_data.status,
         created_at=order_data.created_at
     )
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    # Add order items
-    for item in order_data.items:
-        db_product = db.query(ProductModel).filter(ProductModel.id == item.product_id).first()
-        if not db_product:
-            raise HTTPException(status_code=404, detail=f"Product with ID {item.product_id} not found")
-        
-        db_order_item = OrderItemModel(
-            order_id=db_order.id,
-            product_id=item.product_id,
-            quantity=item.quantity
-        )
-        db.add(db_order_item)
+    await db.flush()
+
+    # One executemany for all line items
+    if lines:
+        await db.execute(insert(OrderItemModel), [dict(line, order_id=db_order.id) for line in lines])
 
-    db.commit()
-    db.refresh(db_order)
+    await db.refresh(db_order, ["items"])
+    await db.commit()
+    await stock_changed(db, cache, search_index, quantities)
 
-    return db_order
+    await jobs.enqueue(OrderPlaced(
+        order_id=db_order.id, user_id=db_order.user_id, total_price=db_order.total_price, items=len(lines)
+    ))
+    return encoded_response(OrderOut, db_order)
     
    
 # Admin only, get all orders
-@order.get("/", response_model=List[OrderOut], dependencies=[Depends(is_admin_user)])
-async def get_orders(db: Session = Depends(get_db)):
-    orders = db.query(OrderModel).all()
-    return orders
+@order.get("/", response_model=List[OrderOut], dependencies=[Depends(is_admin_user), Depends(query_budget(3))])
+async def get_orders(db: AsyncSession = Depends(get_read_db)):
+    orders = (await db.scalars(select(OrderModel).options(selectinload(OrderModel.items)))).all()
+    return encoded_response(OrderOut, orders, many=True)
+
+
+# Newest first, so the (user_id, created_at) index is read backwards and no sort is needed
+def my_orders_query(user_id: int, status: Optional[str], created_from: Optional[datetime], created_to: Optional[datetime]):
+    query = (
+        select(OrderModel)
+        .where(OrderModel.user_id == user_id)
+        .order_by(OrderModel.created_at.desc(), OrderModel.id.desc())
+    )
+    if status is not None:
+        query = query.where(OrderModel.status == status)
+    if created_from is not None:
+        query = query.where(OrderModel.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(OrderModel.created_at < created_to)
+    return query
+
+
+# Current user's orders, keyset paginated on (created_at, id)
+@order.get("/me", response_model=OrderPage, dependencies=[Depends(query_budget(3))])
+async def get_my_orders(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    query = my_orders_query(current_user.id, status, created_from, created_to)
+
+    if cursor is not None:
+        last_created_at, last_id = decode_cursor(cursor, datetime.fromisoformat, int)
+        query = query.where(or_(
+            OrderModel.created_at < last_created_at,
+            and_(OrderModel.created_at == last_created_at, OrderModel.id < last_id)
+        ))
+
+    orders = (await db.scalars(query.options(selectinload(OrderModel.items)).limit(limit + 1))).all()
+    return encoded_response(OrderPage, build_page(orders, limit, lambda o: (o.created_at.isoformat(), o.id)))
+
+
+# One row per order item (or per order without items), ordered so each order's rows are adjacent
+def order_export_query(status: Optional[str], created_from: Optional[datetime], created_to: Optional[datetime]):
+    query = (
+        select(
+            OrderModel.id.label("order_id"), OrderModel.user_id, OrderModel.status, OrderModel.created_at,
+            OrderModel.total_price, OrderItemModel.id.label("item_id"), OrderItemModel.product_id, OrderItemModel.quantity,
+            OrderItemModel.unit_price, OrderItemModel.line_total
+        )
+        .outerjoin(OrderModel.items)
+        .order_by(OrderModel.id, OrderItemModel.id)
+    )
+    if status is not None:
+        query = query.where(OrderModel.status == status)
+    if created_from is not None:
+        query = query.where(OrderModel.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(OrderModel.created_at < created_to)
+    return query
+
+
+# Reads through a server-side cursor in chunks, from the replica when there is one. Uses its own
+# connection because the request's session can be closed before the response body has been sent.
+async def stream_order_rows(query):
+    async with get_read_engine().connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=ORDER_EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+def order_json_line(order: dict) -> bytes:
+    return dump_json(OrderOut, order) + b"\n"
+
+
+async def export_orders_ndjson(query):
+    current = None
+    async for rows in stream_order_rows(query):
+        lines = []
+        for row in rows:
+            if current is None or current["id"] != row.order_id:
+                if current is not None:
+                    lines.append(order_json_line(current))
+                current = {
+                    "id": row.order_id, "user_id": row.user_id, "total_price": row.total_price,
+                    "status": row.status, "created_at": row.created_at, "items": [],
+                }
+            if row.item_id is not None:
+                current["items"].append(
+                    {
+                        "id": row.item_id, "order_id": row.order_id, "product_id": row.product_id, "quantity": row.quantity,
+                        "unit_price": row.unit_price, "line_total": row.line_total,
+                    }
+                )
+        if lines:
+            yield b"".join(lines)
+    if current is not None:
+        yield order_json_line(current)
+
+
+async def export_orders_csv(query):
+    yield csv_line(ORDER_EXPORT_CSV_COLUMNS)
+    async for rows in stream_order_rows(query):
+        yield "".join(
+            csv_line((
+                row.order_id, row.user_id, row.status, row.created_at.isoformat() if row.created_at else "",
+                row.total_price, row.item_id, row.product_id, row.quantity, row.unit_price, row.line_total
+            ))
+            for row in rows
+        )
+
+
+# Admin only, stream orders as NDJSON (one OrderOut per line) or CSV (one line per item)
+@order.get("/export", dependencies=[Depends(is_admin_user)])
+async def export_orders(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    query = order_export_query(status, created_from, created_to)
+
+    if format == "csv":
+        return StreamingResponse(
+            export_orders_csv(query), media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="orders.csv"'}
+        )
+    return StreamingResponse(export_orders_ndjson(query), media_type="application/x-ndjson")
 
 
 # User or admin, get order by id
-@order.get("/{order_id}", response_model=OrderOut)
-async def get_order(order_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
+@order.get("/{order_id}", response_model=OrderOut, dependencies=[Depends(query_budget(2))])
+async def get_order(order_id: int, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    db_order = await db.get(OrderModel, order_id, options=[joinedload(OrderModel.items)])
 
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -63,32 +233,54 @@ async def get_order(order_id: int, current_user: UserModel = Depends(get_current
     if db_order.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to view this order")
 
-    return db_order
+    return encoded_response(OrderOut, db_order)
 
 
 # Admin only, update order
 @order.put("/{order_id}", response_model=OrderOut, dependencies=[Depends(is_admin_user)])
-async def update_order(order_id: int, order_update: OrderUpdate, db: Session = Depends(get_db)):
-    db_order = db.query(OrderModel).filter(OrderModel.id == order_id).first()  
+async def update_order(
+    order_id: int,
+    order_update: OrderUpdate,
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    db_order = await db.get(OrderModel, order_id, options=[joinedload(OrderModel.items)])  
 
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    if order_update.total_price is not None:
-        db_order.total_price = order_update.total_price
-
-    if order_update.status is not None:
+    # Cancelling gives the reserved units back, leaving cancelled takes them again (409 when sold out)
+    stock_moved = False
+    if order_update.status is not None and order_update.status != db_order.status:
+        if order_update.status == "cancelled" and holds_stock(db_order.status):
+            await release_order_stock(db, order_id)
+            stock_moved = True
+        elif db_order.status == "cancelled":
+            await reserve_stock(db, order_quantities(db_order.items))
+            stock_moved = True
         db_order.status = order_update.status
 
-    db.commit()
-    db.refresh(db_order)
+    await db.commit()
+    if stock_moved:
+        await stock_changed(db, cache, search_index, (item.product_id for item in db_order.items))
 
-    return db_order
+    return encoded_response(OrderOut, db_order)
 
 # user only, cancel their own order
 @order.put("/{order_id}/cancel", response_model=OrderOut)
-async def cancel_order(order_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_order = db.query(OrderModel).filter(OrderModel.id == order_id, OrderModel.user_id == current_user.id).first()
+async def cancel_order(
+    order_id: int,
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    db_order = await db.scalar(
+        select(OrderModel)
+        .options(joinedload(OrderModel.items))
+        .where(OrderModel.id == order_id, OrderModel.user_id == current_user.id)
+    )
 
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -96,25 +288,30 @@ async def cancel_order(order_id: int, current_user: UserModel = Depends(get_curr
     if db_order.status == "cancelled": 
         raise HTTPException(status_code = 400, detail="Order already cancelled")
 
+    # Shipped and delivered units are gone, only a reservation goes back to stock
+    released = holds_stock(db_order.status)
+    if released:
+        await release_order_stock(db, order_id)
     db_order.status = "cancelled"
-    db.commit()
-    db.refresh(db_order)
+    await db.commit()
+    if released:
+        await stock_changed(db, cache, search_index, (item.product_id for item in db_order.items))
 
-    return db_order
+    return encoded_response(OrderOut, db_order)
 
 
 # Admin only, delete order
 @order.delete("/{order_id}", response_model=dict, dependencies=[Depends(is_admin_user)])
-async def delete_order(order_id:int, db: Session = Depends(get_db)):
-    db_order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
+async def delete_order(order_id:int, db: AsyncSession = Depends(get_db)):
+    db_order = await db.get(OrderModel, order_id)
 
     if not db_order: 
         raise HTTPException(status_code = 404, detail="Order not found")
 
-    db.delete(db_order)
-    db.commit()
+    await db.delete(db_order)
+    await db.commit()
 
-    return {"message": "Order deleted"}
+    return payload_response({"message": "Order deleted"})
 
 
 
@@ -1,56 +1,274 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from config.db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from sqlalchemy import exc, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+import os
+from config.db import get_db, get_read_db
 from models.product import Product as ProductModel
-from schemas.product import ProductCreate, ProductUpdate, ProductOut
-from models.user import User as UserModel
+from schemas.product import (
+    ProductCreate, ProductImportResult, ProductImportRow, ProductUpdate, ProductOut, ProductPage
+)
+from schemas.user import UserOut
 from utils.auth import get_current_user, is_admin_user
+from utils.query_stats import query_budget
+from utils.cache import CacheBackend, get_product_cache, invalidate_products
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, build_page, decode_cursor, encode_cursor
+from utils.search import ProductSearchIndex, get_product_search_index
+from utils.serialization import encoded_response, negotiate_format, payload_response, serialize
+from utils.streaming import iter_csv_rows, iter_lines, iter_ndjson_rows
+from utils.upsert import upsert
 
-product = APIRouter(prefix="/products", tags = ["products"])
+product = APIRouter(prefix="/products", tags = ["products"], dependencies=[Depends(negotiate_format)])
 
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "500"))
+# Only the first errors are returned so a bad file can't grow the response without bound
+MAX_IMPORT_ERRORS = 1000
 
 
 # Create product
 @product.post("/products", response_model=ProductOut)
-async def create_product(product_data: ProductCreate, current_user: UserModel = Depends(is_admin_user), db: Session = Depends(get_db)):
+async def create_product(
+    product_data: ProductCreate,
+    current_user: UserOut = Depends(is_admin_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
 
     db_product = ProductModel(
         name=product_data.name,
         description=product_data.description,
         price=product_data.price,
-        in_stock=product_data.in_stock)
+        in_stock=product_data.in_stock,
+        stock=product_data.stock)
 
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    return db_product
+    await db.commit()
+    await db.refresh(db_product)
+    await invalidate_products(cache)
+    search_index.add(db_product)
+    return encoded_response(ProductOut, db_product)
 
 
-# Get products
-@product.get("/products", response_model=List[ProductOut])
-async def get_products(db: Session = Depends(get_db)):
-    products = db.query(ProductModel).all()
-    return products
+def validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+# Rows without an id are inserted with one executemany, rows with an id are upserted
+async def write_product_batch(db: AsyncSession, rows: List[dict]):
+    new_rows = [{k: v for k, v in row.items() if k != "id"} for row in rows if row["id"] is None]
+    existing_rows = [row for row in rows if row["id"] is not None]
+
+    if new_rows:
+        await db.execute(insert(ProductModel), new_rows)
+    if existing_rows:
+        statement = upsert(
+            db.get_bind().dialect.name, ProductModel, ["id"],
+            lambda new: {column: getattr(new, column) for column in ("name", "description", "price", "in_stock", "stock")}
+        )
+        await db.execute(statement, existing_rows)
+    await db.commit()
+
+
+# Admin only, bulk import products from an NDJSON or CSV request body, read as it arrives
+@product.post("/products/import", response_model=ProductImportResult)
+async def import_products(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    batch_size: int = Query(PRODUCT_IMPORT_BATCH_SIZE, ge=1, le=10000),
+    current_user: UserOut = Depends(is_admin_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+
+    lines = iter_lines(request.stream())
+    rows = iter_csv_rows(lines) if format == "csv" else iter_ndjson_rows(lines)
+
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    def record_error(number: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({"row": number, "error": message})
+
+    async def flush():
+        nonlocal imported
+        try:
+            await write_product_batch(db, [row for _, row in batch])
+            imported += len(batch)
+        except exc.DBAPIError as e:
+            await db.rollback()
+            for number, _ in batch:
+                record_error(number, f"Batch failed: {e.orig}")
+        batch.clear()
+
+    async for number, row in rows:
+        if isinstance(row, str):
+            record_error(number, row)
+            continue
+        try:
+            batch.append((number, ProductImportRow.model_validate(row).model_dump()))
+        except ValidationError as e:
+            record_error(number, validation_message(e))
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    if imported:
+        await cache.invalidate_prefix("product")
+        search_index.invalidate()
+
+    return payload_response({"imported": imported, "failed": failed, "errors": errors})
+
+
+def filter_products(query, in_stock: Optional[bool], min_price: Optional[float], max_price: Optional[float]):
+    if in_stock is not None:
+        query = query.where(ProductModel.in_stock == in_stock)
+    if min_price is not None:
+        query = query.where(ProductModel.price >= min_price)
+    if max_price is not None:
+        query = query.where(ProductModel.price <= max_price)
+    return query
+
+
+# ids=1,2,3 or ids=1&ids=2, duplicates dropped, request order kept
+def parse_ids(values: List[str]) -> List[int]:
+    ids = {}
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                ids[int(part)] = None
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid product id: {part}")
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+    return list(ids)
+
+
+# Get products, keyset paginated on id. With ids, only those products in one IN query, in the order asked for.
+@product.get("/products", response_model=ProductPage, dependencies=[Depends(query_budget(1))])
+async def get_products(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    ids: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+    cache: CacheBackend = Depends(get_product_cache)
+):
+    if ids is not None:
+        ids = parse_ids(ids)
+        products = {}
+        if ids:
+            query = filter_products(select(ProductModel).where(ProductModel.id.in_(ids)), in_stock, min_price, max_price)
+            products = {p.id: p for p in (await db.scalars(query)).all()}
+        # Unknown ids are left out
+        return encoded_response(ProductPage, {"items": [products[i] for i in ids if i in products], "next_cursor": None})
+
+    last_id = decode_cursor(cursor, int)[0] if cursor is not None else None
+
+    async def load():
+        query = select(ProductModel).order_by(ProductModel.id).limit(limit + 1)
+
+        if last_id is not None:
+            query = query.where(ProductModel.id > last_id)
+        query = filter_products(query, in_stock, min_price, max_price)
+
+        products = (await db.scalars(query)).all()
+        page = build_page(products, limit, lambda p: (p.id,))
+        return serialize(ProductPage, page)
+
+    key = f"products:{limit}:{last_id}:{in_stock}:{min_price}:{max_price}"
+    return payload_response(await cache.get_or_load(key, load))
+
+
+# MySQL ranks with its FULLTEXT index, other databases with the in-process index
+async def search_product_ids(db: AsyncSession, search_index: ProductSearchIndex, q: str, offset: int, count: int,
+                             in_stock: Optional[bool], min_price: Optional[float], max_price: Optional[float]) -> List[int]:
+    if db.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import match
+
+        score = match(ProductModel.name, ProductModel.description, against=q)
+        query = select(ProductModel.id).where(score > 0).order_by(score.desc(), ProductModel.id)
+        query = filter_products(query, in_stock, min_price, max_price).offset(offset).limit(count)
+        return list((await db.scalars(query)).all())
+
+    await search_index.ensure_loaded(db)
+    return search_index.search(q, in_stock, min_price, max_price)[offset:offset + count]
+
+
+# Search products by name and description, best matches first. Cursors are offsets into the ranking.
+@product.get("/products/search", response_model=ProductPage)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_db),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    offset = decode_cursor(cursor, int)[0] if cursor is not None else 0
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    ids = await search_product_ids(db, search_index, q, offset, limit + 1, in_stock, min_price, max_price)
+    next_cursor = encode_cursor(offset + limit) if len(ids) > limit else None
+    ids = ids[:limit]
+
+    products = {}
+    if ids:
+        products = {p.id: p for p in (await db.scalars(select(ProductModel).where(ProductModel.id.in_(ids)))).all()}
+
+    # Keep the ranking order, skipping rows deleted since the index was read
+    return encoded_response(ProductPage, {"items": [products[i] for i in ids if i in products], "next_cursor": next_cursor})
 
 
 # Get product by id
-@product.get("/products/{product_id}", response_model=ProductOut)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
+@product.get("/products/{product_id}", response_model=ProductOut, dependencies=[Depends(query_budget(1))])
+async def get_product(product_id: int, db: AsyncSession = Depends(get_read_db), cache: CacheBackend = Depends(get_product_cache)):
+
+    async def load():
+        product = await db.get(ProductModel, product_id)
+        return serialize(ProductOut, product) if product else None
 
-    product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+    payload = await cache.get_or_load(f"product:{product_id}", load)
 
-    if not product:
+    if payload is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return product
+    return payload_response(payload)
     
 
 # Update product
 @product.put("/products/{product_id}", response_model=ProductOut)
-async def update_product(product_id: int, product_update: ProductUpdate, current_user: UserModel = Depends(is_admin_user), db: Session = Depends(get_db)):
+async def update_product(
+    product_id: int,
+    product_update: ProductUpdate,
+    current_user: UserOut = Depends(is_admin_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
 
-     db_product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+     db_product = await db.get(ProductModel, product_id)
 
      if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -67,23 +285,40 @@ async def update_product(product_id: int, product_update: ProductUpdate, current
      if product_update.in_stock is not None:
         db_product.in_stock = product_update.in_stock
 
-     db.commit()
-     db.refresh(db_product)
+     if product_update.stock is not None:
+        db_product.stock = product_update.stock
+
+     # in_stock follows the counter when stock is tracked, a conflicting in_stock is ignored
+     if db_product.stock is not None:
+        db_product.in_stock = db_product.stock > 0
+
+     await db.commit()
+     await db.refresh(db_product)
+     await invalidate_products(cache, product_id)
+     search_index.add(db_product)
 
-     return db_product
+     return encoded_response(ProductOut, db_product)
 
 
 # Delete product
 @product.delete("/products/{product_id}", response_model=dict)
-async def delete_product(product_id:int, current_user:UserModel = Depends(is_admin_user), db: Session = Depends(get_db)):
-    db_product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+async def delete_product(
+    product_id: int,
+    current_user: UserOut = Depends(is_admin_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_product_cache),
+    search_index: ProductSearchIndex = Depends(get_product_search_index)
+):
+    db_product = await db.get(ProductModel, product_id)
 
     if not db_product: 
         raise HTTPException(status_code = 404, detail="Product not found")
     
-    db.delete(db_product)
-    db.commit()
+    await db.delete(db_product)
+    await db.commit()
+    await invalidate_products(cache, product_id)
+    search_index.remove(product_id)
     
-    return {"message": "Product deleted"}
+    return payload_response({"message": "Product deleted"})
 
 
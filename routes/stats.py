@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from config.db import pool_stats
+from utils.auth import is_admin_user
+from utils.jobs import JobQueue, get_job_queue
+
+stats = APIRouter(prefix="/stats", tags=["stats"], dependencies=[Depends(is_admin_user)])
+
+
+# Admin only, live connection pool statistics
+@stats.get("/db-pool", response_model=dict)
+async def get_pool_stats():
+    return pool_stats()
+
+
+# Admin only, background job queue counters
+@stats.get("/jobs", response_model=dict)
+async def get_job_stats(jobs: JobQueue = Depends(get_job_queue)):
+    return jobs.stats()
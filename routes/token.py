@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import timedelta
 from config.db import get_db
 from models.user import User as UserModel
-from utils.auth import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, verify_password
+from utils.auth import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token
+from utils.passwords import verify_and_update_password
 
 router = APIRouter(
     prefix="/token",
@@ -18,20 +20,27 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @router.post("/", summary="Generate access token")
 async def login_for_access_token(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
    
-    user = db.query(UserModel).filter(UserModel.username == form_data.username).first()
+    user = await db.scalar(select(UserModel).where(UserModel.username == form_data.username))
 
  
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password) if user else (False, None)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Stored hash was made with an old bcrypt cost
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
  
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
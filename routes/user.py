@@ -1,23 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from passlib.context import CryptContext
-from config.db import get_db
+from typing import Optional
+from config.db import get_db, get_read_db
 from models.user import User as UserModel
-from schemas.user import UserCreate, UserOut, UserSelfUpdate, UserUpdate
-from utils.auth import get_current_user, is_admin_user
+from schemas.user import UserCreate, UserOut, UserPage, UserSelfUpdate, UserUpdate
+from utils.auth import get_current_user, invalidate_user, is_admin_user
+from utils.query_stats import query_budget
+from utils.cache import CacheBackend, get_user_cache
+from utils.passwords import get_password_hash
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, build_page, decode_cursor
+from utils.serialization import encoded_response
 
 user = APIRouter(prefix="/users", tags = ["users"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
 # Create user
 @user.post("/users", response_model=UserOut)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    hashed_password = hash_password(user.password)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    hashed_password = await get_password_hash(user.password)
 
     db_user = UserModel(
         username=user.username,
@@ -30,20 +31,30 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-# Get all users, admin only
-@user.get("/", response_model=list[UserOut], dependencies=[Depends(is_admin_user)])
-async def get_users(db: Session = Depends(get_db)):
-    users = db.query(UserModel).all()
-    return users
+# Get all users, admin only, keyset paginated on id
+@user.get("/", response_model=UserPage, dependencies=[Depends(is_admin_user), Depends(query_budget(2))])
+async def get_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    query = select(UserModel).order_by(UserModel.id).limit(limit + 1)
+
+    if cursor is not None:
+        last_id, = decode_cursor(cursor, int)
+        query = query.where(UserModel.id > last_id)
+
+    users = (await db.scalars(query)).all()
+    return encoded_response(UserPage, build_page(users, limit, lambda u: (u.id,)))
 
 # Get user by id, admin can see all, user can only see their own
 @user.get("/{user_id}", response_model=UserOut)
-async def get_user(user_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
+async def get_user(user_id: int, current_user: UserOut = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    db_user = await db.get(UserModel, user_id)
 
     if not db_user: 
         raise HTTPException(status_code=404, detail="User not found")
@@ -51,16 +62,17 @@ async def get_user(user_id: int, current_user: UserModel = Depends(get_current_u
     if db_user.id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to view this user")
 
-    return db_user
+    return encoded_response(UserOut, db_user)
 
 # Update user profile
 @user.put("/profile", response_model=UserOut)
 async def update_own_profile(
     user_update: UserSelfUpdate,
-    current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_user_cache)
 ):
-    db_user = db.query(UserModel).filter(UserModel.id == current_user.id).first()
+    db_user = await db.get(UserModel, current_user.id)
 
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -71,10 +83,11 @@ async def update_own_profile(
     if user_update.last_name is not None:
         db_user.last_name = user_update.last_name
     if user_update.password is not None:
-        db_user.hashed_password = hash_password(user_update.password)
+        db_user.hashed_password = await get_password_hash(user_update.password)
 
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await invalidate_user(cache, db_user.username)
 
     return db_user
 
@@ -84,13 +97,14 @@ async def update_own_profile(
 async def admin_update_user(
     user_id: int,
     user_update: UserUpdate,
-    current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_user_cache)
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can update other users")
 
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    db_user = await db.get(UserModel, user_id)
 
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -103,10 +117,11 @@ async def admin_update_user(
     if user_update.last_name is not None:
         db_user.last_name = user_update.last_name
     if user_update.password is not None:
-        db_user.hashed_password = hash_password(user_update.password)
+        db_user.hashed_password = await get_password_hash(user_update.password)
 
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await invalidate_user(cache, db_user.username)
 
     return db_user
 
@@ -114,29 +129,32 @@ async def admin_update_user(
 # Delete own profile
 @user.delete("/profile", response_model=dict)
 async def delete_own_profile(
-    current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserOut = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    cache: CacheBackend = Depends(get_user_cache)
 ):
-    db_user = db.query(UserModel).filter(UserModel.id == current_user.id).first()
+    db_user = await db.get(UserModel, current_user.id)
 
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    await invalidate_user(cache, db_user.username)
     return {"message": "Your account has been deleted"}
 
 
 # Admin only route to delete any user by id
 @user.delete("/{user_id}", response_model=dict, dependencies=[Depends(is_admin_user)])
-async def admin_delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
+async def admin_delete_user(user_id: int, db: AsyncSession = Depends(get_db), cache: CacheBackend = Depends(get_user_cache)):
+    db_user = await db.get(UserModel, user_id)
 
     if not db_user: 
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    await invalidate_user(cache, db_user.username)
     return {"message": "User deleted"}
 
 
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Any, List, Literal
+
+
+class BatchSubRequest(BaseModel):
+    method: Literal["GET"] = "GET"
+    # Path and query string, e.g. /products/products/3 or /orders/me?limit=10
+    path: str = Field(..., pattern=r"^/")
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest] = Field(..., min_length=1, max_length=20)
+
+
+class BatchSubResponse(BaseModel):
+    status: int
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchSubResponse]
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 
@@ -9,10 +9,10 @@ class CartItemBase(BaseModel):
 
 class CartItemCreate(CartItemBase):
     product_id: int
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 class CartItemUpdate(BaseModel):
-    quantity: Optional[int] = None
+    quantity: Optional[int] = Field(None, gt=0)
 
 class CartItemOut(CartItemBase):
     id: int
@@ -21,6 +21,10 @@ class CartItemOut(CartItemBase):
         from_attributes = True
 
 
+class CartItemsBatch(BaseModel):
+    items: List[CartItemCreate]
+
+
 class CartBase(BaseModel):
     user_id: int
 
@@ -11,19 +11,17 @@ class OrderBase(BaseModel):
 
 class OrderItemCreate(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 
 class OrderCreate(BaseModel):
     user_id: int
-    total_price: float
     status: str = "pending"
     created_at: datetime
     items: List[OrderItemCreate]
 
 
 class OrderUpdate(BaseModel):
-    total_price: Optional[float] = None
     status: Optional[str] = None
 
 
@@ -43,6 +41,8 @@ class OrderItemBase(BaseModel):
 
 class OrderItemOut(OrderItemBase):
     id: int
+    unit_price: float
+    line_total: float
 
     class Config:
         from_attributes = True
@@ -57,6 +57,11 @@ class OrderOut(OrderBase):
         from_attributes = True
 
 
+class OrderPage(BaseModel):
+    items: List[OrderOut]
+    next_cursor: Optional[str] = None
+
+
 class OrderItemUpdate(BaseModel):
     quantity: Optional[int] = None
 
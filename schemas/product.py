@@ -1,21 +1,34 @@
-from pydantic import BaseModel, condecimal, Field
-from typing import Optional
+from pydantic import BaseModel, condecimal, Field, model_validator
+from typing import List, Optional
 
 class ProductBase(BaseModel):
     name: str
     description: Optional[str] = None
     price: float
     in_stock: bool
+    stock: Optional[int] = Field(None, ge=0)
 
 
+# Writes keep in_stock in line with the counter, so stored rows need no check on the way out
 class ProductCreate(ProductBase):
-    pass
+    # in_stock always follows the counter when stock is tracked
+    @model_validator(mode="after")
+    def in_stock_follows_stock(self):
+        if self.stock is not None:
+            self.in_stock = self.stock > 0
+        return self
+
+# Bulk import row, rows with an id update that product if it exists
+class ProductImportRow(ProductCreate):
+    id: Optional[int] = None
+
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     price:Optional[float]
     in_stock: Optional[bool]
+    stock: Optional[int] = Field(None, ge=0)
 
     class Config:
         from_attributes = True
@@ -33,3 +46,19 @@ class ProductOut(ProductBase):
 
     class Config:
         from_attributes = True
+
+
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+
+class ProductImportError(BaseModel):
+    row: int
+    error: str
+
+
+class ProductImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ProductImportError]
@@ -1,21 +1,24 @@
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.db import get_db
 from models.user import User as UserModel
-from passlib.context import CryptContext
+from schemas.user import UserOut
+from utils.cache import CacheBackend, get_user_cache
 from dotenv import load_dotenv
 import os
-import logging
 
 
 load_dotenv()
 
-logging.getLogger('passlib').setLevel(logging.ERROR)
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+# Set while a batch request runs its sub-requests, the token was already checked once for the whole batch
+batch_user: ContextVar = ContextVar("batch_user", default=None)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -24,18 +27,10 @@ if not SECRET_KEY:
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Password verification
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-# Hashing password
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 # Token generation
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -45,8 +40,15 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Function to get current user
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Function to get current user, returns a cached snapshot of the user row
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db), cache: CacheBackend = Depends(get_user_cache)):
+    user = batch_user.get()
+    if user is not None:
+        return user
+
+    # Imported here so jose stays off the cold start path
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -60,14 +62,29 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(UserModel).filter(UserModel.username == username).first()
+    async def load():
+        user = await db.scalar(select(UserModel).where(UserModel.username == username))
+        return UserOut.model_validate(user) if user else None
+
+    user = await cache.get_or_load(f"user:{username}", load)
     if user is None:
         raise credentials_exception
     return user
 
+# Same as get_current_user, but anonymous requests get None instead of a 401
+async def get_optional_user(token: str = Depends(optional_oauth2_scheme), db: AsyncSession = Depends(get_db), cache: CacheBackend = Depends(get_user_cache)):
+    if token is None:
+        return None
+    return await get_current_user(token, db, cache)
+
 # Function to check if user is admin
-def is_admin_user(current_user: UserModel = Depends(get_current_user)):
+def is_admin_user(current_user: UserOut = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions",
         )
-    return current_user
\ No newline at end of file
+    return current_user
+
+# Must be called after any write to a user, so role changes and deletions apply immediately in this
+# process. Other processes only see them once their entry expires, see USER_CACHE_TTL.
+async def invalidate_user(cache: CacheBackend, username: str):
+    await cache.invalidate(f"user:{username}")
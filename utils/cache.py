@@ -0,0 +1,110 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from config.db import REPLICA_DATABASE_URL, REPLICA_STICKY_SECONDS
+
+load_dotenv()
+
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+# Invalidation only reaches the process that made the write. Other instances (each serverless
+# instance is one) keep a demoted or deleted user for up to this long, so keep it short, or plug
+# a shared CacheBackend into get_user_cache when running more than one process.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "5"))
+
+
+# Interface for read-through caches, so a shared backend can replace the in-memory one
+class CacheBackend:
+    async def get_or_load(self, key: str, loader):
+        raise NotImplementedError
+
+    async def invalidate(self, *keys: str):
+        raise NotImplementedError
+
+    async def invalidate_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+# Bounded in-process cache with LRU eviction and a per-entry TTL. For settle seconds after an
+# invalidation loaded values are returned but not stored, since a lagging replica may still
+# serve the old rows.
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entries: int, ttl: float, settle: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.settle = settle
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._invalidated_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get_or_load(self, key: str, loader):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        generation = self._generation
+        value = await loader()
+
+        # An invalidation while we were loading means the value may already be stale
+        if value is not None and generation == self._generation and time.monotonic() - self._invalidated_at >= self.settle:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    async def invalidate(self, *keys: str):
+        self._generation += 1
+        self._invalidated_at = time.monotonic()
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def invalidate_prefix(self, prefix: str):
+        self._generation += 1
+        self._invalidated_at = time.monotonic()
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Product pages are loaded from the read replica when there is one
+product_cache = MemoryCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, REPLICA_STICKY_SECONDS if REPLICA_DATABASE_URL else 0.0)
+user_cache = MemoryCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+# Drop the cached detail payloads for these products and every cached list page
+async def invalidate_products(cache: CacheBackend, *product_ids: int):
+    await cache.invalidate(*(f"product:{product_id}" for product_id in product_ids))
+    await cache.invalidate_prefix("products:")
+
+
+# Dependencies, override them to plug in a different backend
+def get_product_cache() -> CacheBackend:
+    return product_cache
+
+
+def get_user_cache() -> CacheBackend:
+    return user_cache
@@ -0,0 +1,133 @@
+from fastapi import HTTPException
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.cart import CartItem as CartItemModel
+from models.order import OrderItem as OrderItemModel
+from models.product import Product as ProductModel
+from utils.cache import CacheBackend, invalidate_products
+from utils.search import ProductSearchIndex
+
+products = ProductModel.__table__
+
+
+# Check all referenced products with a single IN (...) query
+async def ensure_products_exist(db: AsyncSession, product_ids):
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    found = set((await db.scalars(select(ProductModel.id).where(ProductModel.id.in_(product_ids)))).all())
+    raise_if_missing(product_ids, found)
+
+
+# Current prices of all referenced products, with the same single query and 404
+async def get_product_prices(db: AsyncSession, product_ids) -> dict:
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    rows = (await db.execute(select(ProductModel.id, ProductModel.price).where(ProductModel.id.in_(product_ids)))).all()
+    prices = {product_id: price for product_id, price in rows}
+    raise_if_missing(product_ids, prices)
+    return prices
+
+
+def raise_if_missing(product_ids: set, found):
+    missing = sorted(product_ids - set(found))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Product with ID {missing[0]} not found")
+
+
+# Stock is reserved with one conditional UPDATE ... WHERE stock >= quantity per order, so the
+# database refuses an oversell without a read-then-write and its row locks last until the commit.
+# Products with stock NULL are not tracked and always match. in_stock is assigned first so it
+# sees the old stock on MySQL too, which evaluates SET assignments left to right.
+# Rows with a quantity below 1 never match, a negative one would otherwise add stock.
+async def take_stock(db: AsyncSession, selected, quantity, expected: int):
+    result = await db.execute(
+        update(products)
+        .where(selected, quantity > 0, or_(products.c.stock.is_(None), products.c.stock >= quantity))
+        .ordered_values(
+            (products.c.in_stock, case((products.c.stock.is_(None), products.c.in_stock), else_=products.c.stock > quantity)),
+            (products.c.stock, products.c.stock - quantity),
+        )
+    )
+    if result.rowcount == expected:
+        return
+
+    # Some products matched and were decremented, so roll those back before reporting
+    await db.rollback()
+    invalid = await db.scalar(select(products.c.id).where(selected, quantity <= 0).order_by(products.c.id).limit(1))
+    if invalid is not None:
+        raise HTTPException(status_code=400, detail=f"Quantity must be positive for product {invalid}")
+    short = await db.scalar(
+        select(products.c.id).where(selected, products.c.stock < quantity).order_by(products.c.id).limit(1)
+    )
+    raise HTTPException(status_code=409, detail=f"Insufficient stock for product {short}")
+
+
+# quantities maps product id to the number of units ordered
+async def reserve_stock(db: AsyncSession, quantities: dict):
+    invalid = sorted(product_id for product_id, quantity in quantities.items() if quantity <= 0)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Quantity must be positive for product {invalid[0]}")
+    if quantities:
+        quantity = case(quantities, value=products.c.id)
+        await take_stock(db, products.c.id.in_(quantities), quantity, len(quantities))
+
+
+# Same as reserve_stock for every line of a cart, expected is the number of lines being ordered
+async def reserve_cart_stock(db: AsyncSession, cart_id: int, expected: int):
+    quantity = (
+        select(CartItemModel.quantity)
+        .where(CartItemModel.cart_id == cart_id, CartItemModel.product_id == products.c.id)
+        .scalar_subquery()
+    )
+    selected = products.c.id.in_(select(CartItemModel.product_id).where(CartItemModel.cart_id == cart_id))
+    await take_stock(db, selected, quantity, expected)
+
+
+# Orders in these statuses hold no reserved stock: cancelled ones gave it back, the units of
+# shipped and delivered ones have left the warehouse
+RELEASED_STATUSES = ("cancelled", "shipped", "delivered")
+
+
+def holds_stock(status: str) -> bool:
+    return status not in RELEASED_STATUSES
+
+
+# Units per product of an order's items, as reserve_stock takes them
+def order_quantities(items) -> dict:
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+# Put the units of a cancelled order back in stock
+async def release_order_stock(db: AsyncSession, order_id: int):
+    quantity = (
+        select(func.sum(OrderItemModel.quantity))
+        .where(OrderItemModel.order_id == order_id, OrderItemModel.product_id == products.c.id)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(products)
+        .where(
+            products.c.id.in_(select(OrderItemModel.product_id).where(OrderItemModel.order_id == order_id)),
+            products.c.stock.is_not(None)
+        )
+        .values(stock=products.c.stock + quantity, in_stock=True)
+    )
+
+
+# Call after a stock change commits, so cached product pages and the search index's in_stock
+# filter show the new stock. The flags are only read back when the in-process index is in use.
+async def stock_changed(db: AsyncSession, cache: CacheBackend, search_index: ProductSearchIndex, product_ids):
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    await invalidate_products(cache, *product_ids)
+    if search_index.loaded:
+        rows = await db.execute(select(products.c.id, products.c.in_stock).where(products.c.id.in_(product_ids)))
+        search_index.set_in_stock(dict(rows.all()))
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import uuid
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+load_dotenv()
+
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Retries wait JOB_RETRY_BACKOFF * 2 ** (attempt - 1) seconds, at most JOB_RETRY_BACKOFF_MAX
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "0.5"))
+JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "30"))
+# How long shutdown waits for queued jobs to finish
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "10"))
+
+logger = logging.getLogger("jobs")
+
+# Job type -> handler. Jobs are pydantic models, so a durable backend can store them as JSON.
+job_handlers = {}
+
+
+# Register the coroutine that runs jobs of this type, e.g. @job_handler(OrderPlaced)
+def job_handler(job_type):
+    def register(handler):
+        if job_type in job_handlers:
+            raise ValueError(f"{job_type.__name__} already has a handler")
+        job_handlers[job_type] = handler
+        return handler
+    return register
+
+
+class QueuedJob:
+    def __init__(self, job: BaseModel):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.attempts = 0
+
+
+# Interface for job storage, so a durable store can replace the in-memory one
+class JobBackend:
+    # False when the backend is full
+    async def put(self, queued: QueuedJob) -> bool:
+        raise NotImplementedError
+
+    # Waits for the next job that is ready to run
+    async def get(self) -> QueuedJob:
+        raise NotImplementedError
+
+    # Hand the job out again after delay seconds
+    async def retry(self, queued: QueuedJob, delay: float):
+        raise NotImplementedError
+
+    # The job succeeded or ran out of attempts
+    async def done(self, queued: QueuedJob):
+        raise NotImplementedError
+
+    # Waits until every job put has been done
+    async def join(self):
+        raise NotImplementedError
+
+    # Called once the workers have stopped
+    async def close(self):
+        raise NotImplementedError
+
+    def pending(self) -> int:
+        raise NotImplementedError
+
+
+# Jobs live in this process only, whatever is left at shutdown is lost.
+# Capacity counts jobs waiting, running and waiting for a retry.
+class MemoryJobBackend(JobBackend):
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._reset()
+
+    def _reset(self):
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._timers = set()
+        self._pending = 0
+
+    async def put(self, queued: QueuedJob) -> bool:
+        if self._pending >= self.max_size:
+            return False
+        self._pending += 1
+        self._idle.clear()
+        self._ready.put_nowait(queued)
+        return True
+
+    async def get(self) -> QueuedJob:
+        return await self._ready.get()
+
+    async def retry(self, queued: QueuedJob, delay: float):
+        def ready():
+            self._timers.discard(timer)
+            self._ready.put_nowait(queued)
+
+        timer = asyncio.get_running_loop().call_later(delay, ready)
+        self._timers.add(timer)
+
+    async def done(self, queued: QueuedJob):
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    async def join(self):
+        await self._idle.wait()
+
+    async def close(self):
+        for timer in self._timers:
+            timer.cancel()
+        # Fresh primitives, the old ones belong to the event loop that is shutting down
+        self._reset()
+
+    def pending(self) -> int:
+        return self._pending
+
+
+# Runs jobs on a fixed number of asyncio workers, retrying failures with exponential backoff.
+# Enqueue after committing, so a job never sees a transaction that was rolled back.
+class JobQueue:
+    def __init__(self, backend: JobBackend, workers: int = JOB_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 backoff: float = JOB_RETRY_BACKOFF, max_backoff: float = JOB_RETRY_BACKOFF_MAX):
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._tasks = []
+        self._accepting = True
+        self.enqueued = 0
+        self.dropped = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    # False when the job was dropped, because the queue is full or shutting down.
+    # Callers are not failed for it, side effects must not undo the request's work.
+    async def enqueue(self, job: BaseModel) -> bool:
+        if type(job) not in job_handlers:
+            raise ValueError(f"No handler registered for {type(job).__name__}")
+        if self._accepting and await self.backend.put(QueuedJob(job)):
+            self.enqueued += 1
+            return True
+        self.dropped += 1
+        logger.warning("job queue %s, dropped %s", "full" if self._accepting else "stopped", type(job).__name__)
+        return False
+
+    def start(self):
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    # Stop taking jobs, wait up to timeout for the queued ones, then stop the workers
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self.backend.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("job queue drain timed out with %d jobs left", self.backend.pending())
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.backend.close()
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+
+    async def _work(self):
+        while True:
+            queued = await self.backend.get()
+            name = type(queued.job).__name__
+            queued.attempts += 1
+            try:
+                await job_handlers[type(queued.job)](queued.job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if queued.attempts >= self.max_attempts:
+                    self.failed += 1
+                    logger.exception("job %s %s failed after %d attempts", name, queued.id, queued.attempts)
+                    await self.backend.done(queued)
+                    continue
+                delay = self.retry_delay(queued.attempts)
+                self.retried += 1
+                logger.warning("job %s %s failed (attempt %d), retrying in %.1fs", name, queued.id, queued.attempts,
+                               delay, exc_info=True)
+                await self.backend.retry(queued, delay)
+            else:
+                self.completed += 1
+                await self.backend.done(queued)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "pending": self.backend.pending(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+job_queue = JobQueue(MemoryJobBackend(JOB_QUEUE_SIZE))
+
+
+# Dependency, override it to plug in a different queue
+def get_job_queue() -> JobQueue:
+    return job_queue
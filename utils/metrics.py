@@ -0,0 +1,106 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+# Latency histogram upper bounds in seconds, +Inf is implied
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+# Updated only from the event loop thread with no await in between, so plain ints need no locks
+class RequestMetrics:
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.in_progress = defaultdict(int)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Total HTTP requests by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), histogram in self.latency.items():
+            lines.append(f"http_requests_total{labels(method=method, route=route, status=status)} {histogram.count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by route and status code.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in self.latency.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{labels(method=method, route=route, status=status, le=bound)} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{labels(method=method, route=route, status=status)} {histogram.total}")
+            lines.append(f"http_request_duration_seconds_count{labels(method=method, route=route, status=status)} {histogram.count}")
+
+        lines += [
+            "# HELP http_requests_in_progress HTTP requests currently being served.",
+            "# TYPE http_requests_in_progress gauge",
+        ]
+        for method, value in self.in_progress.items():
+            lines.append(f"http_requests_in_progress{labels(method=method)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in values.items()) + "}"
+
+
+# samples is a list of (labels dict, value) pairs
+def render_metric(name: str, kind: str, help_text: str, samples) -> str:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_values, value in samples:
+        lines.append(f"{name}{labels(**label_values) if label_values else ''} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Pure ASGI middleware, cheaper per request than BaseHTTPMiddleware
+class MetricsMiddleware:
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_progress[method] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.in_progress[method] -= 1
+            # Route templates keep the label set small, unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            self.metrics.latency[(method, route, status)].observe(elapsed)
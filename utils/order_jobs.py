@@ -0,0 +1,20 @@
+import logging
+from pydantic import BaseModel
+from utils.jobs import job_handler
+
+# Order side effects (confirmation emails, analytics, inventory sync) run as jobs, off the request
+
+events_log = logging.getLogger("orders.events")
+
+
+class OrderPlaced(BaseModel):
+    order_id: int
+    user_id: int
+    total_price: float
+    items: int
+
+
+@job_handler(OrderPlaced)
+async def record_order_placed(job: OrderPlaced):
+    events_log.info("order placed: order_id=%d user_id=%d items=%d total_price=%.2f",
+                    job.order_id, job.user_id, job.items, job.total_price)
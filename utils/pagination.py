@@ -0,0 +1,31 @@
+import base64
+import json
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# Cursors are the sort key of the last row on a page, opaque to clients
+def encode_cursor(*values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Each value is parsed with the matching type, e.g. decode_cursor(cursor, int)
+def decode_cursor(cursor: str, *types) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor has the wrong shape")
+        return [parse(value) for parse, value in zip(types, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# Rows must be fetched with limit + 1 so we know whether another page exists
+def build_page(rows, limit: int, key) -> dict:
+    items = rows[:limit]
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
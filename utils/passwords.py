@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Hashes made with a different cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# "thread" or "process"; bcrypt releases the GIL, so threads are usually enough
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+# Jobs allowed in flight at once, extra callers wait instead of queueing unbounded work
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
+
+_pwd_context = None
+_executor = None
+_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+# passlib and the bcrypt backend are loaded on first use to keep cold starts short
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        logging.getLogger('passlib').setLevel(logging.ERROR)
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+def get_hash_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown_hash_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+# Module level so they can be sent to a process pool
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+async def _run(func, *args):
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(get_hash_executor(), func, *args)
+
+
+# Hashing password
+async def get_password_hash(password: str) -> str:
+    return await _run(_hash, password)
+
+
+# Returns (valid, new_hash), new_hash is set when the stored hash should be replaced
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    return await _run(_verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+from config.db import QueryStats, current_query_stats
+
+# "off", "warn" logs requests over budget, "raise" turns them into a 500 (for tests and dev)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn")
+
+logger = logging.getLogger("sql.budget")
+
+
+# Route dependency declaring the most queries a request may run, e.g. Depends(query_budget(3))
+def query_budget(limit: int):
+    async def set_query_budget():
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.budget = limit
+    return set_query_budget
+
+
+# Counts queries per request and reports them in X-DB-Query-Count / X-DB-Query-Time-Ms
+class QueryStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        rejected = False
+
+        async def send_wrapper(message):
+            nonlocal rejected
+            if message["type"] == "http.response.start":
+                if QUERY_BUDGET_MODE != "off" and stats.budget is not None and stats.count > stats.budget:
+                    route = getattr(scope.get("route"), "path", scope["path"])
+                    detail = f"{scope['method']} {route} ran {stats.count} queries, budget is {stats.budget}"
+                    logger.warning("query budget exceeded: %s", detail)
+                    if QUERY_BUDGET_MODE == "raise":
+                        rejected = True
+                        await send_budget_error(send, detail)
+                        return
+
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.count).encode()))
+                headers.append((b"x-db-query-time-ms", f"{stats.seconds * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            elif rejected:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_stats.reset(token)
+
+
+async def send_budget_error(send, detail: str):
+    body = json.dumps({"detail": f"Query budget exceeded: {detail}"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 500,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
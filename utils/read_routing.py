@@ -0,0 +1,41 @@
+import math
+import time
+from starlette.requests import Request
+from config.db import REPLICA_DATABASE_URL, REPLICA_STICKY_SECONDS, ReadRouting, current_read_routing
+
+# Holds the time until which this client's reads stay on the primary
+STICKY_COOKIE = "read_primary_until"
+
+
+def sticky_until(request: Request) -> float:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+# Read-your-writes for replica reads: a request that commits sets a short lived cookie, and the
+# client's reads go to the primary until it expires. A no-op without a replica.
+class ReadRoutingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or REPLICA_DATABASE_URL is None:
+            await self.app(scope, receive, send)
+            return
+
+        routing = ReadRouting(use_primary=sticky_until(Request(scope)) > time.time())
+        token = current_read_routing.set(routing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and routing.wrote:
+                until = time.time() + REPLICA_STICKY_SECONDS
+                cookie = f"{STICKY_COOKIE}={until:.3f}; Max-Age={math.ceil(REPLICA_STICKY_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_read_routing.reset(token)
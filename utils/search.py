@@ -0,0 +1,151 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.product import Product as ProductModel
+
+load_dotenv()
+
+# Rebuild from the database now and then, so writes made by other processes show up
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+# Matches in the name count more than matches in the description
+NAME_WEIGHT = 2
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text) -> list:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+# Inverted index over product name and description, ranked with BM25
+class ProductSearchIndex:
+    def __init__(self, ttl: float = SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._total_length = 0
+        self._loaded_at = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _add(self, product_id: int, name, description, price, in_stock):
+        self._remove(product_id)
+        frequencies = Counter()
+        for token in tokenize(name):
+            frequencies[token] += NAME_WEIGHT
+        for token in tokenize(description):
+            frequencies[token] += 1
+
+        length = sum(frequencies.values())
+        for token, frequency in frequencies.items():
+            self._postings[token][product_id] = frequency
+        self._docs[product_id] = (list(frequencies), length, float(price), bool(in_stock))
+        self._total_length += length
+
+    def _remove(self, product_id: int):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        tokens, length, _, _ = doc
+        for token in tokens:
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+        self._total_length -= length
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            generation = self._generation
+            rows = (await db.execute(select(
+                ProductModel.id, ProductModel.name, ProductModel.description, ProductModel.price, ProductModel.in_stock
+            ))).all()
+
+            self._postings.clear()
+            self._docs.clear()
+            self._total_length = 0
+            for row in rows:
+                self._add(*row)
+            # A write that raced with the scan may be missing, so only trust the index if none happened
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+
+    # Incremental updates are skipped until the index has been built
+    def add(self, product):
+        self._generation += 1
+        if self._loaded_at is not None:
+            self._add(product.id, product.name, product.description, product.price, product.in_stock)
+
+    # Stock changes only touch the in_stock flag, in_stock maps product id to the new value
+    def set_in_stock(self, in_stock: dict):
+        self._generation += 1
+        for product_id, stocked in in_stock.items():
+            doc = self._docs.get(product_id)
+            if doc is not None:
+                self._docs[product_id] = (*doc[:3], bool(stocked))
+
+    def remove(self, product_id: int):
+        self._generation += 1
+        self._remove(product_id)
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = None
+
+    # Matching product ids, best first. Any query term matching is enough, ties are broken on id.
+    def search(self, query: str, in_stock=None, min_price=None, max_price=None) -> list:
+        if not self._docs:
+            return []
+        average_length = self._total_length / len(self._docs)
+        scores = defaultdict(float)
+
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self._docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for product_id, frequency in postings.items():
+                length = self._docs[product_id][1]
+                scores[product_id] += idf * frequency * (K1 + 1) / (
+                    frequency + K1 * (1 - B + B * length / average_length)
+                )
+
+        def keep(product_id):
+            _, _, price, stocked = self._docs[product_id]
+            return (
+                (in_stock is None or stocked == in_stock)
+                and (min_price is None or price >= min_price)
+                and (max_price is None or price <= max_price)
+            )
+
+        matches = [product_id for product_id in scores if keep(product_id)]
+        return sorted(matches, key=lambda product_id: (-scores[product_id], product_id))
+
+    def stats(self) -> dict:
+        return {"documents": len(self._docs), "terms": len(self._postings), "loaded": self.loaded}
+
+
+product_search_index = ProductSearchIndex()
+
+
+# Dependency, override it to plug in a different index
+def get_product_search_index() -> ProductSearchIndex:
+    return product_search_index
@@ -0,0 +1,137 @@
+import typing
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:
+    # MessagePack is only offered when the package is installed
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+response_format: ContextVar = ContextVar("response_format", default=JSON)
+
+
+# Serializers turn ORM rows (or dicts with the same keys) into plain Python values laid out like the
+# response schema, without validating them again: the data comes from our own database, which was
+# validated on the way in. Output is byte for byte what the schema's model_dump_json would produce.
+# Schemas with validators or serializers of their own go through pydantic, so those still apply.
+def _converter(annotation):
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union and type(None) in args:
+        inner = _converter(next(arg for arg in args if arg is not type(None)))
+        if inner is None:
+            return None
+        return lambda value: None if value is None else inner(value)
+    if origin in (list, typing.List):
+        inner = _converter(args[0]) if args else None
+        if inner is None:
+            return list
+        return lambda values: [inner(value) for value in values]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return serializer(annotation)
+    if annotation is float:
+        # Numeric columns load as Decimal
+        return float
+    # str, int, bool and datetime are encoded as they are
+    return None
+
+
+def _has_decorators(schema: typing.Type[BaseModel]) -> bool:
+    decorators = schema.__pydantic_decorators__
+    return any((
+        decorators.validators, decorators.field_validators, decorators.root_validators, decorators.model_validators,
+        decorators.field_serializers, decorators.model_serializers, decorators.computed_fields,
+    ))
+
+
+@lru_cache(maxsize=None)
+def serializer(schema: typing.Type[BaseModel]):
+    if _has_decorators(schema):
+        return lambda obj: schema.model_validate(obj, from_attributes=True).model_dump()
+
+    fields = [(name, _converter(field.annotation)) for name, field in schema.model_fields.items()]
+
+    def serialize(obj) -> dict:
+        # Loaded ORM attributes sit in the instance __dict__, reading it skips the attribute descriptors
+        values = obj if isinstance(obj, dict) else obj.__dict__
+        try:
+            return {name: values[name] if convert is None else convert(values[name]) for name, convert in fields}
+        except KeyError:
+            # Expired or deferred attributes, load them the normal way
+            return {name: getattr(obj, name) if convert is None else convert(getattr(obj, name)) for name, convert in fields}
+
+    return serialize
+
+
+def serialize(schema: typing.Type[BaseModel], content, many: bool = False):
+    convert = serializer(schema)
+    return [convert(obj) for obj in content] if many else convert(content)
+
+
+def dump_json(schema: typing.Type[BaseModel], content, many: bool = False) -> bytes:
+    return orjson.dumps(serialize(schema, content, many))
+
+
+# Highest q the Accept header gives to any of media_types, wildcards included
+def _quality(accept: str, media_types) -> float:
+    best = 0.0
+    for part in accept.split(","):
+        media_range, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        group = media_range.partition("/")[0]
+        if media_range in media_types or media_range == "*/*" or (
+            media_range == f"{group}/*" and any(media_type.startswith(f"{group}/") for media_type in media_types)
+        ):
+            best = max(best, quality)
+    return best
+
+
+# Router dependency, responses are MessagePack when the client's Accept header prefers it to JSON.
+# The choice is reset afterwards, in case the server runs several requests in one context.
+async def negotiate_format(request: Request):
+    accept = request.headers.get("accept", "")
+    if msgpack is None or "msgpack" not in accept or _quality(accept, MSGPACK_TYPES) <= _quality(accept, (JSON,)):
+        yield
+        return
+
+    response_format.set(MSGPACK)
+    try:
+        yield
+    finally:
+        response_format.set(JSON)
+
+
+def _msgpack_default(value):
+    # Same representation as in JSON
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+# Encode already serialized data, e.g. a cached payload, in the negotiated format
+def payload_response(data) -> Response:
+    if response_format.get() == MSGPACK:
+        return Response(msgpack.packb(data, default=_msgpack_default), media_type=MSGPACK, headers={"Vary": "Accept"})
+    return Response(orjson.dumps(data), media_type=JSON, headers={"Vary": "Accept"})
+
+
+# Return this from a handler instead of the ORM object, response_model stays on the route for the docs
+def encoded_response(schema: typing.Type[BaseModel], content, many: bool = False) -> Response:
+    return payload_response(serialize(schema, content, many))
@@ -0,0 +1,100 @@
+import codecs
+import csv
+import io
+import json
+
+# Longer lines are skipped instead of buffered, so a body without newlines can't fill memory
+MAX_LINE_LENGTH = 1_000_000
+# Guards against an unbalanced quote swallowing the rest of a CSV upload
+MAX_CSV_RECORD_LENGTH = 1_000_000
+
+
+# Split a stream of byte chunks into decoded lines without holding the whole body.
+# Lines over max_length are dropped as they arrive and yielded as None.
+async def iter_lines(chunks, encoding: str = "utf-8", max_length: int = MAX_LINE_LENGTH):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parts = []
+    length = 0
+    too_long = False
+
+    def finish(piece: str):
+        nonlocal parts, length, too_long
+        line = None if too_long or length + len(piece) > max_length else ("".join(parts) + piece).rstrip("\r")
+        parts, length, too_long = [], 0, False
+        return line
+
+    def keep(piece: str):
+        nonlocal parts, length, too_long
+        length += len(piece)
+        if too_long or length > max_length:
+            parts, too_long = [], True
+        elif piece:
+            parts.append(piece)
+
+    async for chunk in chunks:
+        # Only the new text is split, the start of the line is already in parts
+        *lines, rest = decoder.decode(chunk).split("\n")
+        for line in lines:
+            yield finish(line)
+        keep(rest)
+    keep(decoder.decode(b"", final=True))
+    if parts or too_long:
+        yield finish("")
+
+
+# Yields (line number, dict or error message) for each non-blank line
+async def iter_ndjson_rows(lines):
+    number = 0
+    async for line in lines:
+        number += 1
+        if line is None:
+            yield number, f"Line longer than {MAX_LINE_LENGTH} characters"
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"Invalid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+# Yields (record number, dict or error message), the first record is the header.
+# A quoted field may span lines, so lines are joined until the quotes balance.
+async def iter_csv_rows(lines):
+    header = None
+    number = 0
+    record = None
+    async for line in lines:
+        if line is None:
+            number += 1
+            record = None
+            yield number, f"Line longer than {MAX_LINE_LENGTH} characters"
+            continue
+        record = line if record is None else f"{record}\n{line}"
+        if record.count('"') % 2:
+            if len(record) > MAX_CSV_RECORD_LENGTH:
+                number += 1
+                record = None
+                yield number, "Record too long, check for an unbalanced quote"
+            continue
+        fields, record = next(csv.reader([record]), []), None
+        if not fields:
+            continue
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        number += 1
+        if len(fields) != len(header):
+            yield number, f"Expected {len(header)} fields, got {len(fields)}"
+            continue
+        yield number, {name: value for name, value in zip(header, fields) if value != ""}
+    if record is not None:
+        yield number + 1, "Unterminated quoted field"
+
+
+def csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
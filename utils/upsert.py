@@ -0,0 +1,12 @@
+from sqlalchemy.dialects import mysql, sqlite
+
+
+# INSERT that updates the existing row on a key conflict, for MySQL and SQLite.
+# values(new) returns the {column: expression} to set, where new refers to the incoming row.
+def upsert(dialect_name: str, model, conflict_columns, values):
+    if dialect_name == "mysql":
+        statement = mysql.insert(model)
+        return statement.on_duplicate_key_update(values(statement.inserted))
+
+    statement = sqlite.insert(model)
+    return statement.on_conflict_do_update(index_elements=conflict_columns, set_=values(statement.excluded))